@@ -0,0 +1,177 @@
+"""Batch classification: several normalized emails per prompt, verdicts keyed by email"""
+from pydantic import ValidationError
+from pydantic_settings import BaseSettings
+from monitoring.metrics import metrics
+from monitoring.usage import count_tokens, track_usage, record, USAGE_FIELDS
+from integrations.llm_cache import FallbackResponse
+from .json_parsing import parse_model, JSONExtractionError
+from .normalize import normalize_body, fit_budget, config as normalize_config
+from .prefilter import prefilter, config as prefilter_config
+from .schemas import ClassificationOutput
+from .nodes import CLASSIFY_RULES
+
+
+class BatchClassifyConfig(BaseSettings):
+    CLASSIFY_BATCH_SIZE: int = 0  # emails per prompt; 0 or 1 keeps one classify call per email
+    CLASSIFY_BATCH_TOKENS: int = 3000  # prompt budget; a batch that would exceed it is split
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = BatchClassifyConfig()
+
+_HEADER = f"""Classify each email below: is it a genuine business inquiry needing a proposal?
+
+{CLASSIFY_RULES}
+
+EMAILS:
+"""
+_FOOTER = """
+Return ONLY a JSON object with one entry per email label, for example:
+{{
+    {example}
+}}"""
+
+
+def _section(label, email):
+    body = email["body"]
+    if normalize_config.NORMALIZE_ENABLED:
+        body = fit_budget(normalize_body(body), normalize_config.TOKEN_BUDGET_CLASSIFY)
+    return f"""### {label}
+From: {email['from']}
+Subject: {email['subject']}
+Body: {body}
+"""
+
+
+def _prompt(sections):
+    labels = [label for label, _ in sections]
+    example = ",\n    ".join(
+        f'"{label}": {{"is_valid": true or false, "confidence": 0.0 to 1.0, "reason": "one sentence"}}'
+        for label in labels
+    )
+    return _HEADER + "\n".join(text for _, text in sections) + _FOOTER.format(example=example)
+
+
+def needs_llm(email):
+    """False when the prefilter would settle this email without the LLM anyway"""
+    if not prefilter_config.PREFILTER_ENABLED:
+        return True
+    decision, _, _ = prefilter({
+        "email_headers": email.get("headers"),
+        "email_from": email["from"],
+        "email_subject": email["subject"],
+        "email_body": email["body"]
+    })
+    return decision == "escalate"
+
+
+def pack(emails, size=None, budget=None):
+    """Split emails into batches of at most ``size`` that fit ``budget`` prompt tokens"""
+    size = size or config.CLASSIFY_BATCH_SIZE
+    budget = budget or config.CLASSIFY_BATCH_TOKENS
+    overhead = count_tokens(_prompt([]))
+    batches, current, used = [], [], overhead
+    for email in emails:
+        label = f"E{len(current) + 1}"
+        cost = count_tokens(_section(label, email)) + 30  # its slot in the example and the answer
+        if current and (len(current) >= size or used + cost > budget):
+            batches.append(current)
+            current, used = [], overhead
+        current.append(email)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def _classify_batch(llm, emails):
+    labels = {f"E{i + 1}": email for i, email in enumerate(emails)}
+    prompt = _prompt([(label, _section(label, email)) for label, email in labels.items()])
+    metrics.incr("batch_classify.prompts")
+    try:
+        # Cached only once every verdict in it validated (below)
+        response = await llm.invoke(prompt, store=False)
+        if isinstance(response, FallbackResponse):
+            raise JSONExtractionError("provider fallback instead of an answer")
+        raw = parse_model(response, None)
+    except JSONExtractionError as e:
+        raw = {}
+        print(f"[DEBUG] Batch classification output unusable: {e}")
+    except Exception as e:
+        # Typically the provider rejecting an over-long context: halve and retry
+        if len(emails) == 1:
+            print(f"[ERROR] Batch classification failed for {emails[0]['id']}: {e}")
+            return {}
+        metrics.incr("batch_classify.splits")
+        middle = len(emails) // 2
+        return {**await _classify_batch(llm, emails[:middle]), **await _classify_batch(llm, emails[middle:])}
+
+    verdicts = {}
+    for label, email in labels.items():
+        try:
+            verdicts[email["id"]] = ClassificationOutput.model_validate(raw.get(label)).model_dump()
+        except ValidationError:
+            # Missing or malformed entry: this email goes through the single-email prompt
+            metrics.incr("batch_classify.item_fallbacks")
+    if len(verdicts) == len(labels):
+        await llm.cache_response(prompt, response)
+    else:
+        await llm.forget_response(prompt)
+    return verdicts
+
+
+def _share(usage, emails):
+    """Split one prompt's usage across the emails it classified: ``{email_id: usage}``"""
+    shares = {email["id"]: {"provider": usage["provider"]} for email in emails}
+    for field in USAGE_FIELDS:
+        value = usage[field]
+        if isinstance(value, float):
+            for share in shares.values():
+                share[field] = value / len(emails)
+        else:
+            # Whole counts: the remainder goes to the first emails
+            each, extra = divmod(value, len(emails))
+            for i, share in enumerate(shares.values()):
+                share[field] = each + (i < extra)
+    return shares
+
+
+async def _tracked_batch(llm, emails, slots):
+    """One batch under the provider's concurrency slot, with its usage split per email"""
+    import asyncio
+    import contextlib
+    import time
+    with track_usage() as usage:
+        queued = time.perf_counter()
+        async with slots or contextlib.nullcontext():
+            record(queue_wait=time.perf_counter() - queued)
+            verdicts = await _classify_batch(llm, emails)
+    return verdicts, _share(usage, emails)
+
+
+async def classify_emails(llm, emails, slots=None):
+    """Verdicts and usage for the emails that need the LLM.
+
+    Returns ``(verdicts, usage)``: ``verdicts`` maps email_id to
+    ``{is_valid, confidence, reason}``; ``usage`` maps email_id to its share
+    of the batch prompts' LLM usage, which the graph books to the classify
+    node. ``slots`` is the provider semaphore single-email runs also share.
+
+    Emails without a verdict (prefilter-decided, or dropped from a bad batch
+    answer) are classified by the graph's own classify node as usual.
+    """
+    import asyncio
+    pending = [email for email in emails if needs_llm(email)]
+    if not pending:
+        return {}, {}
+    batches = pack(pending)
+    print(f"[DEBUG] Batch-classifying {len(pending)} emails in {len(batches)} prompt(s)")
+    results = await asyncio.gather(*(_tracked_batch(llm, batch, slots) for batch in batches))
+    verdicts, usage = {}, {}
+    for batch_verdicts, batch_usage in results:
+        verdicts.update(batch_verdicts)
+        usage.update(batch_usage)
+    metrics.incr("batch_classify.items", len(verdicts))
+    return verdicts, usage
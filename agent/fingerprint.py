@@ -0,0 +1,75 @@
+"""SimHash fingerprints for near-duplicate inquiry detection"""
+import re
+import hashlib
+from email.utils import parseaddr
+from pydantic import Field
+from pydantic_settings import BaseSettings
+
+SIMHASH_BITS = 64
+# Four 16-bit bands: two fingerprints within 3 bits must agree on at least one band
+# (pigeonhole), so an exact match on any band column finds every candidate.
+SIMHASH_BANDS = 4
+_BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+
+
+class DedupConfig(BaseSettings):
+    DEDUP_ENABLED: bool = False
+    # Hamming bits; the band lookup only guarantees recall up to SIMHASH_BANDS - 1
+    DEDUP_MAX_DISTANCE: int = Field(default=3, ge=0, le=SIMHASH_BANDS - 1)
+    DEDUP_WINDOW_DAYS: int = 30  # only match inquiries this recent
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = DedupConfig()
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_body(body):
+    """Lower-case words of the body, minus quoted reply lines"""
+    lines = [l for l in (body or "").splitlines() if not l.lstrip().startswith(">")]
+    return _WORD.findall(" ".join(lines).lower())
+
+
+def shingles(words, size=3):
+    if len(words) < size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+def simhash(text_or_words):
+    """64-bit SimHash over word 3-shingles; None for an empty body"""
+    words = normalize_body(text_or_words) if isinstance(text_or_words, str) else text_or_words
+    grams = shingles(words)
+    if not grams:
+        return None
+    weights = [0] * SIMHASH_BITS
+    for gram in grams:
+        h = int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+
+def bands(fingerprint):
+    mask = (1 << _BAND_BITS) - 1
+    return [(fingerprint >> (i * _BAND_BITS)) & mask for i in range(SIMHASH_BANDS)]
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def to_signed(fingerprint):
+    """SQLite INTEGER is signed 64-bit"""
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def sender_address(sender):
+    return parseaddr(sender or "")[1].lower()
@@ -1,35 +1,203 @@
 """LangGraph workflow orchestration"""
+import time
+from typing import Literal
 from langgraph.graph import StateGraph, END
+from pydantic_settings import BaseSettings
 from .state import EmailAgentState
 from .nodes import AgentNodes
+from .prefilter import config as prefilter_config
+from .fingerprint import config as dedup_config
+from .normalize import config as normalize_config
+from .checkpointing import run_config, list_thread_ids, delete_thread
 from integrations.llm_wrapper import UnifiedLLM
+from app.services.event_broker import broker
+from monitoring.metrics import metrics
+from monitoring.usage import track_usage, merge_usage, record
+
+class GraphConfig(BaseSettings):
+    # One LLM call for classify+extract instead of two (falls back to both on bad output)
+    AGENT_FUSED_CLASSIFY: bool = False
+    # Start extract alongside classify: always, when the prefilter score is at least
+    # AGENT_SPECULATE_MIN_SCORE, or when the provider has a free concurrency slot
+    AGENT_SPECULATION: Literal["off", "always", "prefilter", "capacity"] = "off"
+    AGENT_SPECULATE_MIN_SCORE: float = 0.5
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = GraphConfig()
 
 class EmailAgentGraph:
-    def __init__(self, llm: UnifiedLLM):
+    def __init__(self, llm: UnifiedLLM, fused=None, prefilter=None, dedup=None, checkpointer=None,
+                 speculation=None, spare_capacity=None, normalize=None):
         self.nodes = AgentNodes(llm)
+        self.checkpointer = checkpointer
+        self.fused = config.AGENT_FUSED_CLASSIFY if fused is None else fused
+        self.speculation = config.AGENT_SPECULATION if speculation is None else speculation
+        self.spare_capacity = spare_capacity  # callable -> bool, used by the "capacity" policy
+        self.prefilter = prefilter_config.PREFILTER_ENABLED if prefilter is None else prefilter
+        self.dedup = dedup_config.DEDUP_ENABLED if dedup is None else dedup
+        self.normalize = normalize_config.NORMALIZE_ENABLED if normalize is None else normalize
         self.graph = self._build_graph()
     
+    def _traced(self, name, fn):
+        """Wrap a node: live dashboard events, plus its wall time and LLM usage in state"""
+        async def node(state):
+            broker.publish("node_started", email_id=state["email_id"], node=name)
+            started = time.perf_counter()
+            with track_usage() as usage:
+                try:
+                    result = await fn(state)
+                except Exception:
+                    metrics.incr(f"node.{name}.errors")
+                    raise
+            elapsed = time.perf_counter() - started
+
+            step = result.get("current_step") or ""
+            usage["node_fallback"] = step.endswith(("_fallback", "_failed"))
+            # A node can run twice (fused fallback), so times and usage accumulate
+            timings = dict(result.get("timings") or {})
+            timings[name] = timings.get(name, 0.0) + elapsed
+            node_usage = dict(result.get("usage") or {})
+            node_usage[name] = merge_usage(node_usage.get(name), usage)
+            result["timings"], result["usage"] = timings, node_usage
+
+            metrics.observe(f"node.{name}.seconds", elapsed)
+            if usage["calls"]:
+                metrics.observe(f"node.{name}.llm_seconds", usage["llm_seconds"])
+                metrics.observe(f"node.{name}.prompt_tokens", usage["prompt_tokens"])
+                metrics.observe(f"node.{name}.completion_tokens", usage["completion_tokens"])
+            for field in ("calls", "cache_hits", "fallbacks", "errors", "retries"):
+                if usage[field]:
+                    metrics.incr(f"node.{name}.{field}", usage[field])
+            if usage["node_fallback"]:
+                metrics.incr(f"node.{name}.node_fallbacks")
+
+            broker.publish("node_finished", email_id=state["email_id"], node=name, step=step, seconds=round(elapsed, 3))
+            return result
+        return node
+
+    def _should_speculate(self, state):
+        if self.speculation == "always":
+            return True
+        if self.speculation == "prefilter":
+            # No score without a trained prefilter model: nothing to speculate on
+            score = state.get("prefilter_score")
+            return score is not None and score >= config.AGENT_SPECULATE_MIN_SCORE
+        if self.speculation == "capacity":
+            return self.spare_capacity is not None and self.spare_capacity()
+        return False
+
+    async def _classify(self, state):
+        """Classify node; speculatively extracts in parallel when the policy allows it"""
+        if state.get("batch_usage"):
+            # This email's share of the multi-email prompt counts as classify usage
+            record(**state["batch_usage"])
+        verdict = state.get("batch_verdict")
+        if verdict:
+            # Already classified in a multi-email prompt at fetch time
+            metrics.incr("batch_classify.applied")
+            state.update({
+                "is_valid_inquiry": verdict["is_valid"],
+                "confidence_score": verdict["confidence"],
+                "classification_reason": verdict.get("reason", "No reason provided"),
+                "classified_by": "llm",
+                "current_step": "classified"
+            })
+            return state
+        if self._should_speculate(state):
+            return await self.nodes.classify_with_speculative_extract(state)
+        if self.speculation != "off":
+            metrics.incr("speculation.skipped")
+        return await self.nodes.classify_email(state)
+
     def _build_graph(self):
         workflow = StateGraph(EmailAgentState)
         
         # Add all nodes
-        workflow.add_node("classify", self.nodes.classify_email)
-        workflow.add_node("extract", self.nodes.extract_requirements)
-        workflow.add_node("plan", self.nodes.generate_plan)
-        workflow.add_node("cost", self.nodes.calculate_cost)
-        workflow.add_node("propose", self.nodes.generate_proposal)
+        workflow.add_node("classify", self._traced("classify", self._classify))
+        workflow.add_node("extract", self._traced("extract", self.nodes.extract_requirements))
+        workflow.add_node("plan", self._traced("plan", self.nodes.generate_plan))
+        workflow.add_node("cost", self._traced("cost", self.nodes.calculate_cost))
+        workflow.add_node("propose", self._traced("propose", self.nodes.generate_proposal))
         
-        # Entry point
-        workflow.set_entry_point("classify")
+        # Entry point: normalize -> prefilter -> dedup -> LLM classification, each stage optional
+        llm_entry = "classify_extract" if self.fused else "classify"
+
+        def route_to_llm(state):
+            if state.get("classified_by") == "prefilter" and state["is_valid_inquiry"]:
+                # Classification is settled; the fused node still does the extraction
+                return llm_entry if self.fused else "extract"
+            return llm_entry
+
+        llm_targets = {llm_entry: llm_entry, "extract": "extract"}
+        first_gate = "dedup" if self.dedup else None
+
+        if self.prefilter:
+            workflow.add_node("prefilter", self._traced("prefilter", self.nodes.prefilter_email))
+            entry = "prefilter"
+
+            def route_after_prefilter(state):
+                if state["current_step"] == "prefilter_reject":
+                    return END
+                return first_gate or route_to_llm(state)
+
+            targets = {**llm_targets, END: END}
+            if first_gate:
+                targets[first_gate] = first_gate
+            workflow.add_conditional_edges("prefilter", route_after_prefilter, targets)
+        else:
+            entry = first_gate or llm_entry
+
+        if self.normalize:
+            workflow.add_node("normalize", self._traced("normalize", self.nodes.normalize_email))
+            workflow.set_entry_point("normalize")
+            workflow.add_edge("normalize", entry)
+        else:
+            workflow.set_entry_point(entry)
+
+        if self.dedup:
+            workflow.add_node("dedup", self._traced("dedup", self.nodes.find_duplicate))
+
+            def route_after_dedup(state):
+                if state["current_step"] == "duplicate":
+                    return END
+                if state["current_step"] == "dedup_reused":
+                    return "propose"  # only the personalised letter is regenerated
+                return route_to_llm(state)
+
+            workflow.add_conditional_edges(
+                "dedup",
+                route_after_dedup,
+                {**llm_targets, "propose": "propose", END: END}
+            )
+
+        if self.fused:
+            workflow.add_node("classify_extract", self._traced("classify_extract", self.nodes.classify_and_extract))
+
+            def route_after_fused(state):
+                if state["current_step"] == "fused_failed":
+                    return "classify"
+                return "plan" if state["is_valid_inquiry"] else END
+
+            workflow.add_conditional_edges(
+                "classify_extract",
+                route_after_fused,
+                {"classify": "classify", "plan": "plan", END: END}
+            )
         
         # Conditional routing
         def route_after_classify(state):
-            return "extract" if state["is_valid_inquiry"] else END
+            if not state["is_valid_inquiry"]:
+                return END
+            # A kept speculative extraction already ran in the classify node
+            return "plan" if state["current_step"] in ("extracted", "extraction_fallback") else "extract"
         
         workflow.add_conditional_edges(
             "classify",
             route_after_classify,
-            {"extract": "extract", END: END}
+            {"extract": "extract", "plan": "plan", END: END}
         )
         
         # Linear flow for valid emails
@@ -38,10 +206,18 @@ class EmailAgentGraph:
         workflow.add_edge("cost", "propose")
         workflow.add_edge("propose", END)
         
-        return workflow.compile()
+        return workflow.compile(checkpointer=self.checkpointer)
     
-    async def process_email(self, email_data: dict) -> dict:
-        """Process single email through complete workflow"""
+    async def process_email(self, email_data: dict, queue_wait: float = 0.0) -> dict:
+        """Process single email through complete workflow
+
+        With a checkpointer, a run that was interrupted part-way resumes after
+        its last completed node, and one that already finished (but was never
+        cleared) returns its final state without calling the LLM again.
+
+        ``queue_wait`` is how long the email waited for a provider slot; it is
+        recorded in ``timings`` next to each node's wall time.
+        """
         initial_state = {
             "messages": [],
             "email_id": email_data["id"],
@@ -49,6 +225,21 @@ class EmailAgentGraph:
             "email_subject": email_data["subject"],
             "email_body": email_data["body"],
             "thread_id": email_data["thread_id"],
+            # Kept in the checkpoint so a resumed run still commits the whole thread
+            "message_id": email_data.get("message_id"),
+            "references": email_data.get("references") or [],
+            "coalesced": email_data.get("coalesced") or [],
+            "email_headers": email_data.get("headers", {}),
+            "classified_by": None,
+            "fingerprint": None,
+            "duplicate_of": None,
+            "prefilter_score": None,
+            "batch_verdict": email_data.get("batch_verdict"),
+            "batch_usage": email_data.get("batch_usage"),
+            "email_body_clean": None,
+            "token_counts": None,
+            "timings": {"queue_wait": queue_wait},
+            "usage": {},
             "is_valid_inquiry": False,
             "confidence_score": 0.0,
             "needs_human_review": True,
@@ -56,4 +247,68 @@ class EmailAgentGraph:
             "error": None
         }
         
-        return await self.graph.ainvoke(initial_state)
+        started = time.perf_counter()
+        if self.checkpointer is None:
+            return self._finish_timings(await self.graph.ainvoke(initial_state), started)
+
+        run = run_config(email_data["id"])
+        snapshot = await self.graph.aget_state(run)
+        if snapshot.values:
+            if snapshot.next:
+                print(f"[DEBUG] Resuming {email_data['id']} at {', '.join(snapshot.next)}")
+                return self._finish_timings(await self.graph.ainvoke(None, run), started)
+            print(f"[DEBUG] Reusing finished run for {email_data['id']}")
+            return snapshot.values
+        return self._finish_timings(await self.graph.ainvoke(initial_state, run), started)
+
+    def _finish_timings(self, state, started):
+        """Add this invocation's total wall time (a resumed run only counts its own part)"""
+        timings = dict(state.get("timings") or {})
+        timings["total"] = timings.get("total", 0.0) + time.perf_counter() - started
+        state["timings"] = timings
+        metrics.observe("pipeline.total_seconds", timings["total"])
+        if timings.get("queue_wait"):
+            metrics.observe("pipeline.queue_wait_seconds", timings["queue_wait"])
+        return state
+
+    async def clear_run(self, email_id):
+        """Drop an email's checkpoints once its result is persisted"""
+        if self.checkpointer is not None:
+            await delete_thread(self.checkpointer, str(email_id))
+
+    async def run_email(self, email_id):
+        """Rebuild the email dict a checkpointed run started from; None if there is no run"""
+        snapshot = await self.graph.aget_state(run_config(email_id))
+        values = snapshot.values
+        if not values:
+            return None
+        email = {
+            "id": values["email_id"],
+            "from": values["email_from"],
+            "subject": values["email_subject"],
+            "body": values["email_body"],
+            "thread_id": values["thread_id"],
+            "message_id": values.get("message_id"),
+            "references": values.get("references") or [],
+            "headers": values.get("email_headers") or {}
+        }
+        if values.get("coalesced"):
+            email["coalesced"] = values["coalesced"]
+        return email
+
+    async def pending_runs(self):
+        """Checkpointed runs that never got persisted: interrupted, failed or uncommitted"""
+        runs = []
+        for thread_id in await list_thread_ids(self.checkpointer):
+            snapshot = await self.graph.aget_state(run_config(thread_id))
+            values = snapshot.values or {}
+            runs.append({
+                "email_id": thread_id,
+                "subject": values.get("email_subject"),
+                "from": values.get("email_from"),
+                "next": list(snapshot.next),
+                "current_step": values.get("current_step"),
+                "error": values.get("error"),
+                "updated_at": snapshot.created_at
+            })
+        return runs
@@ -0,0 +1,310 @@
+"""Tolerant JSON extraction for LLM output: find, repair, validate, optionally re-ask once"""
+import json
+from contextlib import aclosing
+from pydantic import ValidationError
+from pydantic_settings import BaseSettings
+from monitoring.metrics import metrics
+from monitoring.usage import record
+
+
+class JSONParsingConfig(BaseSettings):
+    # One short "fix this JSON" call before a node gives up and uses its fallback
+    LLM_JSON_REPAIR_PROMPT: bool = True
+    # Stream node calls and stop reading at the closing brace (bypasses the response cache)
+    LLM_JSON_STREAM: bool = False
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = JSONParsingConfig()
+
+_QUOTES = {'"': '"', "'": "'", "“": "”"}
+_LITERALS = {"true": "true", "false": "false", "null": "null", "True": "true", "False": "false",
+             "None": "null", "NaN": "null", "Infinity": "null", "undefined": "null"}
+
+
+class JSONExtractionError(ValueError):
+    """The response held no usable object; ``errors`` lists each problem found"""
+
+    def __init__(self, message, errors=None, raw=""):
+        super().__init__(message)
+        self.errors = errors or [message]
+        self.raw = raw
+
+
+class JSONObjectScanner:
+    """Incremental finder for the first balanced JSON object in a stream of text.
+
+    ``feed`` returns the object text as soon as its closing brace arrives, so a
+    streaming caller can stop generation there. Brackets inside strings are ignored.
+    """
+
+    def __init__(self, start=0):
+        self.text = ""
+        self.result = None
+        self._pos = start
+        self._start = None
+        self._depth = 0
+        self._quote = None
+        self._escape = False
+
+    def feed(self, chunk):
+        if self.result is not None:
+            return self.result
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._start is None:
+                if ch == "{":
+                    self._start, self._depth = i, 1
+            elif self._quote:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == self._quote:
+                    self._quote = None
+            elif ch in _QUOTES:
+                self._quote = _QUOTES[ch]
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.result = text[self._start:i + 1]
+                    self._pos = i + 1
+                    return self.result
+        self._pos = len(text)
+        return None
+
+    @property
+    def start(self):
+        return self._start
+
+    def partial(self):
+        """Text from the opening brace on, for repairing a truncated response"""
+        return None if self._start is None else self.text[self._start:]
+
+
+def _is_number(word):
+    try:
+        float(word)
+        return True
+    except ValueError:
+        return False
+
+
+def repair_json(text):
+    """Fix the defects models commonly produce; the result may still be invalid.
+
+    Handles code fences, comments, single or curly quotes, Python/JS literals,
+    unquoted keys, missing and trailing commas, and truncation (open strings and
+    brackets are closed).
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+
+    out = []
+    stack = []
+    i, n = 0, len(text)
+
+    def last_significant():
+        for piece in reversed(out):
+            stripped = piece.rstrip()
+            if stripped:
+                return stripped[-1]
+        return ""
+
+    def needs_comma():
+        return last_significant() in ('"', "}", "]") or last_significant().isalnum()
+
+    def drop_trailing_comma():
+        while out and not out[-1].strip():
+            out.pop()
+        if out and out[-1].rstrip().endswith(","):
+            out[-1] = out[-1].rstrip()[:-1]
+
+    while i < n:
+        ch = text[i]
+        if ch in _QUOTES:
+            close = _QUOTES[ch]
+            j, chars = i + 1, []
+            while j < n and text[j] != close:
+                if text[j] == "\\" and j + 1 < n:
+                    nxt = text[j + 1]
+                    chars.append(nxt if nxt == "'" else "\\" + nxt)
+                    j += 2
+                    continue
+                chars.append('\\"' if text[j] == '"' else text[j])
+                j += 1
+            if needs_comma():
+                out.append(",")
+            out.append('"' + "".join(chars) + '"')
+            i = j + 1
+        elif text.startswith("//", i):
+            i = text.find("\n", i)
+            i = n if i < 0 else i
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+        elif ch in "{[":
+            if needs_comma():
+                out.append(",")
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+            i += 1
+        elif ch in "}]":
+            drop_trailing_comma()
+            if stack:
+                out.append(stack.pop())
+            i += 1
+        elif ch.isalpha() or ch == "_" or ch in "-+" or ch.isdigit():
+            j = i + 1
+            while j < n and (text[j].isalnum() or text[j] in "_.+-"):
+                j += 1
+            word = text[i:j]
+            if needs_comma():
+                out.append(",")
+            rest = text[j:].lstrip()
+            if rest.startswith(":") and not word[0].isdigit():
+                out.append(json.dumps(word))  # unquoted key
+            elif word in _LITERALS:
+                out.append(_LITERALS[word])
+            elif _is_number(word):
+                out.append(word.lstrip("+"))
+            else:
+                out.append(json.dumps(word))  # unquoted string value
+            i = j
+        else:
+            out.append(ch)
+            i += 1
+
+    # Truncated output: finish the last member, then close what is still open
+    drop_trailing_comma()
+    if last_significant() == ":":
+        out.append("null")
+    out.extend(reversed(stack))
+    return "".join(out)
+
+
+def _json_error(e):
+    return f"invalid JSON at line {e.lineno} column {e.colno}: {e.msg}"
+
+
+def _validation_errors(e):
+    return [f"{'.'.join(str(p) for p in err['loc']) or 'object'}: {err['msg']}" for err in e.errors()]
+
+
+def parse_model(text, model):
+    """Validated dict from the first JSON object in ``text``.
+
+    Tries each opening brace in turn (a preamble may contain braces), parses
+    as-is, then repaired. Raises JSONExtractionError with every problem found.
+    With ``model=None`` the parsed object is returned unvalidated.
+    """
+    errors = []
+    start = 0
+    for _ in range(5):
+        scanner = JSONObjectScanner(start)
+        candidate = scanner.feed(text) or scanner.partial()
+        if candidate is None:
+            break
+        for attempt in (candidate, repair_json(candidate)):
+            try:
+                data = json.loads(attempt, strict=False)
+            except json.JSONDecodeError as e:
+                errors.append(_json_error(e))
+                continue
+            if not isinstance(data, dict):
+                errors.append(f"expected a JSON object, got {type(data).__name__}")
+                continue
+            try:
+                result = data if model is None else model.model_validate(data).model_dump()
+            except ValidationError as e:
+                # Well-formed but wrong: neither repair nor a later brace will help
+                errors = _validation_errors(e)
+                raise JSONExtractionError("; ".join(errors), errors, text) from None
+            metrics.incr("json_parse.repaired" if attempt is not candidate else "json_parse.clean")
+            return result
+        start = scanner.start + 1
+
+    if not errors:
+        errors.append(f"no JSON object in response starting {text[:60]!r}")
+    raise JSONExtractionError("; ".join(dict.fromkeys(errors)), errors, text)
+
+
+def _schema_hint(model):
+    lines = []
+    for name, field in model.model_fields.items():
+        kind = getattr(field.annotation, "__name__", None) or str(field.annotation).replace("typing.", "")
+        lines.append(f"- {name}: {kind}{' (required)' if field.is_required() else ''}")
+    return "\n".join(lines)
+
+
+async def _read_object(llm, prompt):
+    """Stream the response, stopping as soon as the first object is complete"""
+    scanner = JSONObjectScanner()
+    async with aclosing(llm.astream(prompt)) as stream:
+        async for chunk in stream:
+            if scanner.feed(chunk) is not None:
+                metrics.incr("json_parse.stream_early_stops")
+                break
+    return scanner.text
+
+
+async def generate_json(llm, prompt, model, repair=None, stream=None):
+    """Call the LLM and return its answer validated against ``model``.
+
+    On failure, optionally sends one short repair prompt (the bad output, the
+    errors and the field list, but not the original email) before raising
+    JSONExtractionError.
+    """
+    repair = config.LLM_JSON_REPAIR_PROMPT if repair is None else repair
+    stream = config.LLM_JSON_STREAM if stream is None else stream
+
+    # Only a validated answer goes into the response cache; a retry must not replay a bad one
+    response = await _read_object(llm, prompt) if stream else await llm.invoke(prompt, store=False)
+    try:
+        result = parse_model(response, model)
+    except JSONExtractionError as e:
+        if not stream:
+            await llm.forget_response(prompt)  # an entry stored before validation, if any
+        if not repair:
+            metrics.incr("json_parse.failed")
+            raise
+        print(f"[DEBUG] {model.__name__} output rejected ({e}); asking for a repair")
+        first_error = e
+    else:
+        if not stream:
+            await llm.cache_response(prompt, response)
+        return result
+
+    metrics.incr("json_parse.repair_prompts")
+    record(retries=1)
+    repair_prompt = f"""This response was supposed to be a single JSON object but could not be used.
+
+RESPONSE:
+{response[:4000]}
+
+PROBLEMS:
+{chr(10).join('- ' + err for err in first_error.errors)}
+
+REQUIRED FIELDS:
+{_schema_hint(model)}
+
+Return ONLY the corrected JSON object:"""
+    repaired = await llm.invoke(repair_prompt, store=False)
+    try:
+        result = parse_model(repaired, model)
+    except JSONExtractionError:
+        await llm.forget_response(repair_prompt)
+        metrics.incr("json_parse.failed")
+        raise first_error
+    await llm.cache_response(repair_prompt, repaired)
+    metrics.incr("json_parse.repair_successes")
+    return result
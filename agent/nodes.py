@@ -3,42 +3,131 @@ import json
 from typing import Dict, Any
 from langchain_core.messages import SystemMessage, HumanMessage
 from integrations.llm_wrapper import UnifiedLLM
+from app.services.event_broker import broker
+from monitoring.metrics import metrics
+from .prefilter import prefilter
+from .fingerprint import simhash, sender_address, config as dedup_config
+from .json_parsing import generate_json
+from .normalize import normalize_body, body_for, count_tokens
+from .proposal_renderer import (
+    paragraph_prompts, clean_paragraph, default_paragraph, render_proposal, proposal_frame, config as proposal_config
+)
+from .schemas import ClassificationOutput, ExtractionOutput, FusedOutput, ProjectPlan
+
+# Shared by the single, fused and batch classification prompts
+CLASSIFY_RULES = """RULES - Email IS VALID if:
+- Person asks about building/developing something (app, website, tool, system, etc.)
+- Person asks for consulting, training, or professional services
+- Person describes a business problem needing a solution
+- Message is reasonably detailed (not one-word spam)
+
+Rules - Email IS NOT VALID if:
+- It's spam, promotional, or recruiting
+- It's a job application
+- It's generic "I'll pay you big money" with no details
+- It's obviously auto-generated marketing"""
 
 class AgentNodes:
     def __init__(self, llm: UnifiedLLM):
         self.llm = llm
     
-    def _clean_json(self, response: str) -> str:
-        """Clean markdown formatting from JSON response"""
-        response = response.strip()
-        if response.startswith("```json"):
-            response = response[7:]
-        if response.startswith("```"):
-            response = response[3:]
-        if response.endswith("```"):
-            response = response[:-3]
-        return response.strip()
+    def _name_from_address(self, email_from: str) -> str:
+        """Best-effort client name from the From header"""
+        if '<' in email_from:
+            # Format: "Name <email@example.com>"
+            return email_from.split('<')[0].strip().strip('"')
+        # Format: "email@example.com" - parse username
+        # e.g. "krishguptano12@gmail.com" -> "Krishguptano"
+        import re
+        username = email_from.split('@')[0]
+        # Remove numbers and split camelCase/snake_case
+        name_parts = re.sub(r'[0-9_.-]', ' ', username).strip()
+        return ' '.join(word.capitalize() for word in name_parts.split())
+
+    async def normalize_email(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Node 0: Trim the body to what the LLM nodes need (no LLM call)"""
+        state["email_body_clean"] = normalize_body(state["email_body"])
+        counts = {
+            "original": count_tokens(state["email_body"]),
+            "normalized": count_tokens(state["email_body_clean"]),
+            # What each prompt actually receives after its budget
+            "classify": count_tokens(body_for(state, "classify")),
+            "extract": count_tokens(body_for(state, "extract"))
+        }
+        print(f"[DEBUG] Body tokens: {counts}")
+        metrics.incr("normalize.tokens_in", counts["original"])
+        metrics.incr("normalize.tokens_out", counts["extract"])
+        state.update({"token_counts": counts, "current_step": "normalized"})
+        return state
+
+    async def prefilter_email(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Node 0: Header rules + local classifier, no LLM call"""
+        decision, p_inquiry, reason = prefilter(state)
+        print(f"[DEBUG] Prefilter: {decision} ({reason})")
+        state["current_step"] = f"prefilter_{decision}"
+        state["prefilter_score"] = p_inquiry
+        if decision != "escalate":
+            state.update({
+                "is_valid_inquiry": decision == "accept",
+                "confidence_score": p_inquiry if decision == "accept" else 1 - p_inquiry,
+                "classified_by": "prefilter"
+            })
+        return state
+
+    async def find_duplicate(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Node 0b: Reuse extraction/plan/cost from a near-identical recent inquiry"""
+        from datetime import datetime, timedelta
+        from email.utils import parseaddr
+        from integrations.storage import StorageService
+
+        fingerprint = simhash(state["email_body"])
+        state["fingerprint"] = fingerprint
+        state["current_step"] = "dedup_miss"
+        if fingerprint is None:
+            return state
+
+        storage = StorageService()
+        try:
+            since = datetime.utcnow() - timedelta(days=dedup_config.DEDUP_WINDOW_DAYS)
+            match = storage.find_near_duplicate(fingerprint, dedup_config.DEDUP_MAX_DISTANCE, since)
+            if not match:
+                return state
+            row, distance = match
+            previous = json.loads(row.pipeline_state)
+        finally:
+            storage.close()
+
+        state["duplicate_of"] = row.email_id
+        if sender_address(state["email_from"]) == row.sender:
+            # Same person re-sending the same inquiry: it already has a proposal
+            print(f"[DEBUG] Duplicate of {row.email_id} (distance {distance}), skipping")
+            state.update({"is_valid_inquiry": False, "current_step": "duplicate"})
+            return state
+
+        print(f"[DEBUG] Near-duplicate of {row.email_id} (distance {distance}), reusing plan and cost")
+        display_name, address = parseaddr(state["email_from"])
+        state.update({
+            # Rows stored before the field list shrank still carry the earlier client's name and company
+            **{k: v for k, v in previous.items() if k in StorageService.REUSABLE_FIELDS},
+            # The project is shared, the person is not: name them from their own address
+            "client_name": display_name or address.split("@")[0] or "Unknown",
+            "company": None,
+            "is_valid_inquiry": True,
+            "confidence_score": 1.0,
+            "current_step": "dedup_reused"
+        })
+        return state
 
     async def classify_email(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """Node 1: Classify if business inquiry with clear rules"""
         prompt = f"""Classify if this email is a genuine business inquiry needing a proposal.
 
-RULES - Email IS VALID if:
-- Person asks about building/developing something (app, website, tool, system, etc.)
-- Person asks for consulting, training, or professional services
-- Person describes a business problem needing a solution
-- Message is reasonably detailed (not one-word spam)
-
-Rules - Email IS NOT VALID if:
-- It\'s spam, promotional, or recruiting
-- It\'s a job application
-- It\'s generic "I\'ll pay you big money" with no details
-- It\'s obviously auto-generated marketing
+{CLASSIFY_RULES}
 
 Email to analyze:
 Subject: {state['email_subject']}
 From: {state['email_from']}
-Body: {state['email_body']}
+Body: {body_for(state, 'classify')}
 
 Return ONLY valid JSON:
 {{
@@ -47,24 +136,20 @@ Return ONLY valid JSON:
     "reason": "one sentence explanation"
 }}"""
         
-        response = None
         try:
-            response = await self.llm.invoke(prompt)
-            result = json.loads(self._clean_json(response))
+            result = await generate_json(self.llm, prompt, ClassificationOutput)
             
             print(f"[DEBUG] Classification Result: {result}")
             state.update({
                 "is_valid_inquiry": result["is_valid"],
                 "confidence_score": result["confidence"],
                 "classification_reason": result.get("reason", "No reason provided"),
+                "classified_by": "llm",
                 "current_step": "classified"
             })
         except Exception as e:
             # Check if response was empty or blocked
-            if not response and not str(e):
-                error_msg = "Empty response from LLM"
-            else:
-                error_msg = f"LLM Error: {str(e)}"
+            error_msg = f"LLM Error: {str(e)}" if str(e) else "Empty response from LLM"
                 
             state.update({
                 "is_valid_inquiry": False,
@@ -75,6 +160,106 @@ Return ONLY valid JSON:
         
         return state
     
+    async def classify_and_extract(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Node 1+2 fused: classify and extract in one call (email body is sent once)"""
+        prompt = f"""Classify and extract: decide if this email is a genuine business inquiry needing a proposal, and if so pull out the client details.
+
+{CLASSIFY_RULES}
+
+Email to analyze:
+Subject: {state['email_subject']}
+From: {state['email_from']}
+Body: {body_for(state, 'extract')}
+
+EXTRACTION GUIDELINES (only when is_valid is true, otherwise use null):
+- client_name: Look for signature, name mentions, or parse from email address
+- company: Business name if mentioned, otherwise null or infer from domain
+- project_type: What they want built (be SPECIFIC, e.g., "Custom CRM for Real Estate", not just "CRM")
+- requirements: 3-5 specific features or requirements mentioned
+- timeline: When they need it (e.g., "ASAP", "3 months", "Q1 2026")
+- budget: Any budget mentioned, or "Flexible" if not stated
+
+Return ONLY valid JSON:
+{{
+    "is_valid": true or false,
+    "confidence": 0.0 to 1.0,
+    "reason": "one sentence explanation",
+    "client_name": "Debabrata G.",
+    "company": "Investment Firm",
+    "email": "debabrata@example.com",
+    "project_type": "AI Portfolio Management System",
+    "requirements": ["Real-time tracking", "Risk analysis", "Trading alerts"],
+    "timeline": "3 months",
+    "budget": "$15000-$25000"
+}}"""
+
+        try:
+            result = await generate_json(self.llm, prompt, FusedOutput)
+        except Exception as e:
+            # The graph routes this back through the separate classify/extract nodes
+            print(f"[DEBUG] Fused classify+extract rejected, falling back: {e}")
+            state["current_step"] = "fused_failed"
+            return state
+
+        print(f"[DEBUG] Fused Classification Result: {result['is_valid']} ({result['confidence']})")
+        state.update({
+            "is_valid_inquiry": result["is_valid"],
+            "confidence_score": result["confidence"],
+            "classification_reason": result.get("reason", "No reason provided"),
+            "classified_by": "llm",
+            "current_step": "classified"
+        })
+        if result["is_valid"]:
+            state.update({
+                "client_name": result["client_name"],
+                "company": result.get("company"),
+                "email": result.get("email"),
+                "project_type": result["project_type"],
+                "requirements": result["requirements"],
+                "timeline": result.get("timeline") or "To be determined",
+                "budget": result.get("budget") or "Flexible",
+                "current_step": "extracted"
+            })
+        return state
+
+    async def classify_with_speculative_extract(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Node 1 with node 2 started alongside it; the extraction is dropped if the email is invalid"""
+        import asyncio
+        import time
+
+        # Each node mutates the dict it is given, so they work on separate copies
+        started = time.perf_counter()
+        extract_task = asyncio.create_task(self.extract_requirements(dict(state)))
+        try:
+            classified = await self.classify_email(dict(state))
+        except BaseException:
+            extract_task.cancel()
+            raise
+        classify_seconds = time.perf_counter() - started
+        metrics.incr("speculation.launched")
+
+        if not classified["is_valid_inquiry"]:
+            extract_task.cancel()
+            wasted = time.perf_counter() - started
+            metrics.incr("speculation.misses")
+            metrics.incr("speculation.wasted_seconds_total", wasted)
+            metrics.observe("speculation.wasted_seconds", wasted)
+            print(f"[DEBUG] Speculative extraction discarded ({wasted:.2f}s of LLM time wasted)")
+            return classified
+
+        extracted = await extract_task
+        extract_seconds = time.perf_counter() - started
+        # Run one after the other, the two calls would have taken classify + extract
+        saved = min(classify_seconds, extract_seconds)
+        metrics.incr("speculation.hits")
+        metrics.incr("speculation.saved_seconds_total", saved)
+        metrics.observe("speculation.saved_seconds", saved)
+        print(f"[DEBUG] Speculative extraction kept ({saved:.2f}s off the critical path)")
+
+        changes = {k: v for k, v in extracted.items() if k not in state or state[k] != v}
+        classified.update(changes)
+        return classified
+
     async def extract_requirements(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """Node 2: Extract client data with detailed guidance"""
         prompt = f"""Extract structured information from this inquiry email.
@@ -82,7 +267,7 @@ Return ONLY valid JSON:
 Email:
 From: {state['email_from']}
 Subject: {state['email_subject']}
-Body: {state['email_body']}
+Body: {body_for(state, 'extract')}
 
 EXTRACTION GUIDELINES:
 - client_name: Look for signature, name mentions, or parse from email address
@@ -106,30 +291,19 @@ EXAMPLE OUTPUT:
 Return ONLY valid JSON with extracted data:"""
         
         try:
-            response = await self.llm.invoke(prompt)
-            data = json.loads(self._clean_json(response))
+            data = await generate_json(self.llm, prompt, ExtractionOutput)
             
             state.update({
                 **data,
+                "client_name": data["client_name"] or self._name_from_address(state['email_from']) or "Valued Client",
+                "timeline": data["timeline"] or "To be determined",
+                "budget": data["budget"] or "Flexible",
                 "current_step": "extracted"
             })
         except Exception as e:
             # Intelligent fallback: parse name from email address
-            email_from = state['email_from']
-            # Extract name from email (e.g., "krishguptano12@gmail.com" -> "Krish Gupta")
-            if '<' in email_from:
-                # Format: "Name <email@example.com>"
-                client_name = email_from.split('<')[0].strip()
-            else:
-                # Format: "email@example.com" - parse username
-                username = email_from.split('@')[0]
-                # Remove numbers and split camelCase/snake_case
-                import re
-                name_parts = re.sub(r'[0-9_.-]', ' ', username).strip()
-                client_name = ' '.join(word.capitalize() for word in name_parts.split())
-            
             state.update({
-                "client_name": client_name or "Valued Client",
+                "client_name": self._name_from_address(state['email_from']) or "Valued Client",
                 "company": None,
                 "project_type": state.get('email_subject', 'Custom Project'),
                 "requirements": ["Discuss detailed requirements"],
@@ -202,10 +376,10 @@ EXAMPLE COMPLEX PROJECT (160 hours):
 Return ONLY valid JSON with project plan:"""
         
         try:
-            response = await self.llm.invoke(prompt)
-            state["project_plan"] = json.loads(self._clean_json(response))
+            state["project_plan"] = await generate_json(self.llm, prompt, ProjectPlan)
             state["current_step"] = "planned"
         except Exception as e:
+            print(f"[DEBUG] Plan output unusable, using fallback: {e}")
             # Fallback based on project type
             is_complex = "portfolio" in state['project_type'].lower() or "finance" in state['project_type'].lower()
             
@@ -245,6 +419,9 @@ Return ONLY valid JSON with project plan:"""
     
     async def generate_proposal(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """Node 5: Generate detailed professional proposal email"""
+        if proposal_config.PROPOSAL_MODE == "hybrid":
+            return await self._generate_hybrid_proposal(state)
+
         phases = state["project_plan"]["phases"]
         phases_text = "\n".join([f"• {p['name']}: {p['duration']} ({p.get('hours', '?')} hours)" for p in phases])
         cost = state["cost_estimate"]
@@ -290,8 +467,19 @@ FORMATTING: Use double line breaks between sections for readability
 Return ONLY the email body text (no JSON, no markdown formatting, just plain text with line breaks):"""
         
         try:
-            state["proposal_text"] = await self.llm.invoke(prompt)
+            # Streamed (and so never cached): the dashboard shows tokens as they arrive,
+            # while the stored proposal is only ever the complete text
+            chunks = []
+            try:
+                async for chunk in self.llm.astream(prompt):
+                    chunks.append(chunk)
+                    broker.publish("proposal_token", email_id=state["email_id"], text=chunk)
+            except Exception:
+                broker.publish("proposal_reset", email_id=state["email_id"])
+                raise
+            state["proposal_text"] = "".join(chunks)
             state["current_step"] = "proposal_generated"
+            metrics.incr("proposal.llm_output_tokens", count_tokens(state["proposal_text"]))
         except Exception as e:
             state["proposal_text"] = f"""Dear {state['client_name']},
 
@@ -332,3 +520,63 @@ OttoMail Solutions"""
         
         return state
 
+    async def _generate_hybrid_proposal(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Node 5 (hybrid): template for plan/cost/next steps, two short LLM paragraphs written concurrently"""
+        import asyncio
+        from integrations.llm_cache import FallbackResponse
+
+        prompts = paragraph_prompts(state)
+        head, middle, tail = proposal_frame(state)
+        queues = {section: asyncio.Queue() for section in prompts}
+
+        async def write(section, prompt):
+            # Streamed (and so never cached): identical plans still get freshly written paragraphs
+            chunks = []
+            try:
+                async for chunk in self.llm.astream(prompt):
+                    chunks.append(chunk)
+                    queues[section].put_nowait(chunk)
+            finally:
+                queues[section].put_nowait(None)
+            text = "".join(chunks)
+            return FallbackResponse(text) if any(isinstance(c, FallbackResponse) for c in chunks) else text
+
+        streamed = []
+
+        def publish(text):
+            if text:
+                streamed.append(text)
+                broker.publish("proposal_token", email_id=state["email_id"], text=text)
+
+        tasks = [asyncio.create_task(write(section, prompt)) for section, prompt in prompts.items()]
+        try:
+            # Reading order: the second paragraph's tokens wait until the first one is done
+            publish(head)
+            for section, after in zip(prompts, (middle, tail)):
+                while (chunk := await queues[section].get()) is not None:
+                    publish(chunk)
+                publish(after)
+            responses = await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        paragraphs, fell_back = {}, False
+        for section, response in zip(prompts, responses):
+            usable = isinstance(response, str) and not isinstance(response, FallbackResponse)
+            text = clean_paragraph(response) if usable else ""
+            if not text:
+                print(f"[DEBUG] Proposal section {section} unusable, using default: {response if not usable else 'empty'}")
+                fell_back = True
+                text = default_paragraph(section, state)
+            else:
+                metrics.incr("proposal.llm_output_tokens", count_tokens(text))
+            paragraphs[section] = text
+
+        state["proposal_text"] = render_proposal(state, **paragraphs)
+        state["current_step"] = "proposal_fallback" if fell_back else "proposal_generated"
+        if " ".join("".join(streamed).split()) != " ".join(state["proposal_text"].split()):
+            # Cleaning or a default paragraph changed the letter; show what is actually stored
+            broker.publish("proposal_reset", email_id=state["email_id"])
+            broker.publish("proposal_token", email_id=state["email_id"], text=state["proposal_text"])
+        return state
@@ -0,0 +1,152 @@
+"""Email body normalization: drop quoted history, signatures and footers, then fit a token budget"""
+import re
+from pydantic_settings import BaseSettings
+from monitoring.usage import count_tokens
+
+
+class NormalizeConfig(BaseSettings):
+    NORMALIZE_ENABLED: bool = True
+    # Approximate tokens of email body each LLM node gets (extraction needs the detail)
+    TOKEN_BUDGET_CLASSIFY: int = 250
+    TOKEN_BUDGET_EXTRACT: int = 600
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = NormalizeConfig()
+
+_REPLY_HEADER = re.compile(
+    r"^(On .{0,200}wrote:?|-{2,}\s*Original Message\s*-{2,}|_{10,}|From:\s.+|Sent from my \w+.*)$",
+    re.IGNORECASE
+)
+_SIGN_OFF = re.compile(
+    r"^((best|kind|warm|many)\s+)?(regards|wishes|thanks|thank you|cheers|sincerely|best)\b.{0,20}$",
+    re.IGNORECASE
+)
+_FOOTER = re.compile(
+    r"intended recipient|(this|the) (e-?mail|message)\b.{0,120}\b(confidential|privileged)|"
+    r"(click|tap) here to unsubscribe|unsubscribe (here|from|at any time)|to unsubscribe|"
+    r"view (this email )?in (your )?browser|manage (your )?(email |subscription )?preferences|"
+    r"you (are )?receiv\w+ this (e-?mail|message) because",
+    re.IGNORECASE
+)
+_INVISIBLE = re.compile("[\u200b\u200c\u200d\u2060\ufeff\u00ad]")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+_KEYWORDS = re.compile(
+    r"\b(need|needs|want|looking|build|develop|app|application|website|site|system|platform|tool|"
+    r"integrat\w*|feature\w*|requirement\w*|budget|cost|price|quote|timeline|deadline|launch|"
+    r"weeks?|months?|asap|company|team|users?|customers?|api|database|dashboard|automat\w*|ai)\b",
+    re.IGNORECASE
+)
+_MONEY_OR_NUMBER = re.compile(r"[$€£]|\d")
+
+
+def strip_quoted(text):
+    """Cut the quoted reply chain: '>' lines and everything after a reply header.
+
+    A header with (almost) nothing above it is a forward, whose quoted part is
+    the inquiry itself, so it is kept.
+    """
+    kept = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if _REPLY_HEADER.match(stripped) and len(" ".join(kept).split()) >= 5:
+            break
+        if stripped.startswith(">"):
+            continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def strip_signature(text):
+    """Drop the signature block but keep the sign-off and the two lines after it (name, company)"""
+    lines = text.splitlines()
+    stripped = [l.rstrip() for l in lines]
+    if "--" in stripped:
+        i = stripped.index("--")
+        return "\n".join(lines[:i] + [l for l in lines[i + 1:] if l.strip()][:2])
+    # The last sign-off, so a "Thanks for the quick reply" opener is not mistaken for one
+    for i in range(len(lines) - 1, -1, -1):
+        if _SIGN_OFF.match(lines[i].strip()):
+            return "\n".join(lines[:i + 1] + [l for l in lines[i + 1:] if l.strip()][:2])
+    return text
+
+
+def drop_sign_off(text):
+    """Cut a message at its last sign-off, for bodies that are joined after it"""
+    lines = text.splitlines()
+    for i in range(len(lines) - 1, -1, -1):
+        if _SIGN_OFF.match(lines[i].strip()):
+            return "\n".join(lines[:i]).rstrip()
+    return text
+
+
+def strip_footers(text):
+    """Remove paragraphs that are legal disclaimers or mailing-list/tracking footers"""
+    paragraphs = re.split(r"\n\s*\n", text)
+    # The first paragraph is the message itself, whatever it mentions
+    return "\n\n".join(p for i, p in enumerate(paragraphs) if i == 0 or not _FOOTER.search(p))
+
+
+def collapse_whitespace(text):
+    text = _INVISIBLE.sub("", text.replace("\xa0", " ").replace("\r\n", "\n").replace("\r", "\n"))
+    text = re.sub(r"[ \t]+", " ", text)
+    text = "\n".join(line.strip() for line in text.splitlines())
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def normalize_body(body):
+    """The part of an email body the model actually needs"""
+    text = collapse_whitespace(body or "")
+    text = strip_quoted(text)
+    text = strip_footers(text)
+    text = strip_signature(text)
+    return collapse_whitespace(text)
+
+
+def _score(unit, opening):
+    words = len(unit.split())
+    score = len(_KEYWORDS.findall(unit)) * 2 + (3 if _MONEY_OR_NUMBER.search(unit) else 0)
+    if opening:
+        score += 3  # the first real sentence usually states the ask
+    if words < 4:
+        score -= 2  # greetings, "Thanks!", bare names
+    return score
+
+
+def fit_budget(text, budget):
+    """Keep the most informative sentences that fit in ``budget`` tokens, in original order"""
+    if count_tokens(text) <= budget:
+        return text
+
+    units = []
+    for line in text.splitlines():
+        units.extend(s for s in _SENTENCE.split(line) if s.strip())
+    opening = next((i for i, u in enumerate(units) if len(u.split()) >= 4), 0)
+    ranked = sorted(range(len(units)), key=lambda i: (-_score(units[i], i == opening), i))
+
+    chosen, used = set(), 0
+    for i in ranked:
+        cost = count_tokens(units[i]) + 1
+        if used + cost <= budget:
+            chosen.add(i)
+            used += cost
+    if not chosen:
+        return text[:budget * 4]
+
+    parts, previous = [], -1
+    for i in sorted(chosen):
+        if previous >= 0 and i != previous + 1:
+            parts.append("[...]")
+        parts.append(units[i])
+        previous = i
+    return "\n".join(parts)
+
+
+def body_for(state, node):
+    """Email body to paste into ``node``'s prompt: normalized and budgeted when available"""
+    clean = state.get("email_body_clean")
+    if clean is None:
+        return state["email_body"]
+    return fit_budget(clean, getattr(config, f"TOKEN_BUDGET_{node.upper()}"))
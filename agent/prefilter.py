@@ -0,0 +1,163 @@
+"""Zero-LLM pre-classification: header heuristics + hashed n-gram naive Bayes"""
+import os
+import re
+import json
+import math
+import zlib
+from pydantic_settings import BaseSettings
+
+
+class PrefilterConfig(BaseSettings):
+    PREFILTER_ENABLED: bool = False
+    PREFILTER_MODEL_PATH: str = "prefilter_model.json"
+    # P(inquiry) at or below this ends the run without an LLM call
+    PREFILTER_REJECT_BELOW: float = 0.05
+    # P(inquiry) at or above this skips the LLM classify step
+    PREFILTER_ACCEPT_ABOVE: float = 0.98
+    PREFILTER_MIN_TRAINING: int = 50  # don't trust a model trained on fewer emails
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = PrefilterConfig()
+
+HASH_BUCKETS = 1 << 18
+_TOKEN = re.compile(r"[a-z0-9$']+")
+_NOREPLY = re.compile(r"(no[-_.]?reply|do[-_.]?not[-_.]?reply|mailer-daemon|postmaster|notifications?|bounce)[^@]*@", re.I)
+
+
+def header_signals(headers, sender):
+    """Return ``(verdict, reasons)``; verdict is "bulk" when headers alone are conclusive"""
+    headers = {k.lower(): str(v).strip().lower() for k, v in (headers or {}).items() if v}
+    strong, weak = [], []
+    if headers.get("precedence") in ("bulk", "list", "junk"):
+        strong.append(f"Precedence: {headers['precedence']}")
+    auto = headers.get("auto-submitted")
+    if auto and auto != "no":
+        strong.append(f"Auto-Submitted: {auto}")
+    if "list-unsubscribe" in headers:
+        weak.append("List-Unsubscribe")
+    if "list-id" in headers:
+        weak.append("List-Id")
+    noreply = bool(sender and _NOREPLY.search(sender))
+    if noreply:
+        weak.append("noreply sender")
+    # A mailing-list header from a noreply address is as good as Precedence: bulk.
+    # List headers alone are not: a real client can write from a list or a CRM.
+    if strong or (noreply and len(weak) >= 2):
+        return "bulk", strong + weak
+    return ("suspect" if weak else None), weak
+
+
+def _features(text):
+    tokens = _TOKEN.findall(text.lower())
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return [zlib.crc32(g.encode()) % HASH_BUCKETS for g in grams]
+
+
+def email_text(subject, sender, body):
+    domain = sender.rsplit("@", 1)[-1].strip("> ") if sender and "@" in sender else ""
+    return f"{subject or ''} {domain} {(body or '')[:4000]}"
+
+
+class NaiveBayesModel:
+    """Multinomial naive Bayes over hashed unigrams+bigrams (classes: 1 inquiry, 0 not)"""
+
+    def __init__(self, counts=None, totals=None, docs=None, vocab=None):
+        self.counts = counts or {"0": {}, "1": {}}
+        self.totals = totals or {"0": 0, "1": 0}
+        self.docs = docs or {"0": 0, "1": 0}
+        self.vocab = vocab or 0
+
+    @property
+    def trained_on(self):
+        return self.docs["0"] + self.docs["1"]
+
+    def fit(self, samples):
+        """``samples`` is an iterable of ``(text, is_inquiry)``"""
+        seen = set()
+        for text, label in samples:
+            label = "1" if label else "0"
+            self.docs[label] += 1
+            counts = self.counts[label]
+            for f in _features(text):
+                key = str(f)
+                counts[key] = counts.get(key, 0) + 1
+                self.totals[label] += 1
+                seen.add(key)
+        self.vocab = len(seen | set(self.counts["0"]) | set(self.counts["1"]))
+        return self
+
+    def predict_proba(self, text, prior_log_odds=0.0):
+        """P(inquiry | text); ``prior_log_odds`` lets header evidence shift the prior"""
+        if not self.docs["0"] or not self.docs["1"]:
+            return 0.5
+        total_docs = self.trained_on
+        score = {label: math.log(self.docs[label] / total_docs) for label in ("0", "1")}
+        vocab = max(self.vocab, 1)
+        for f in _features(text):
+            key = str(f)
+            for label in ("0", "1"):
+                score[label] += math.log((self.counts[label].get(key, 0) + 1) / (self.totals[label] + vocab))
+        log_odds = score["1"] - score["0"] + prior_log_odds
+        log_odds = max(min(log_odds, 50.0), -50.0)
+        return 1 / (1 + math.exp(-log_odds))
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"counts": self.counts, "totals": self.totals, "docs": self.docs, "vocab": self.vocab}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(**json.load(f))
+
+
+_model_cache = {}
+
+
+def load_model(path=None):
+    """Load the trained model once per file version; None when missing or undertrained"""
+    path = path or config.PREFILTER_MODEL_PATH
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    cached = _model_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        model = NaiveBayesModel.load(path)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"[ERROR] Could not load prefilter model {path}: {e}")
+        model = None
+    if model and (model.trained_on < config.PREFILTER_MIN_TRAINING or not all(model.docs.values())):
+        # A model that never saw one of the classes can only answer 0.5
+        print(f"[DEBUG] Prefilter model trained on {model.docs} emails per class; using header rules only")
+        model = None
+    _model_cache[path] = (mtime, model)
+    return model
+
+
+def prefilter(state, model=None):
+    """Return ``(decision, p_inquiry, reason)``; decision is "reject", "accept" or "escalate".
+
+    ``p_inquiry`` is None when there is no trained model to score the email.
+    """
+    verdict, reasons = header_signals(state.get("email_headers"), state.get("email_from"))
+    if verdict == "bulk":
+        return "reject", 0.0, "bulk headers: " + ", ".join(reasons)
+
+    model = model or load_model()
+    if model is None:
+        return "escalate", None, "no trained model"
+
+    # One weak bulk signal is not conclusive, but it should lean the model towards "not inquiry"
+    prior = -2.0 if verdict == "suspect" else 0.0
+    text = email_text(state.get("email_subject"), state.get("email_from"), state.get("email_body"))
+    p = model.predict_proba(text, prior_log_odds=prior)
+    if p <= config.PREFILTER_REJECT_BELOW:
+        return "reject", p, f"classifier p(inquiry)={p:.3f}" + (f" ({', '.join(reasons)})" if reasons else "")
+    if p >= config.PREFILTER_ACCEPT_ABOVE and verdict is None:
+        return "accept", p, f"classifier p(inquiry)={p:.3f}"
+    return "escalate", p, f"ambiguous p(inquiry)={p:.3f}"
@@ -0,0 +1,134 @@
+"""Hybrid proposal rendering: Jinja2 for the sections fixed by plan and cost, the LLM for two short paragraphs"""
+import re
+from pathlib import Path
+from typing import Literal
+from jinja2 import Environment, FileSystemLoader, StrictUndefined
+from pydantic_settings import BaseSettings
+
+
+class ProposalConfig(BaseSettings):
+    # "hybrid" renders the letter from a template and asks the LLM for two paragraphs;
+    # "llm" has the model write the whole letter (about 3x the output tokens)
+    PROPOSAL_MODE: Literal["hybrid", "llm"] = "hybrid"
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = ProposalConfig()
+
+_env = Environment(
+    loader=FileSystemLoader(Path(__file__).parent / "templates"),
+    undefined=StrictUndefined,
+    trim_blocks=True,
+    lstrip_blocks=True,
+    auto_reload=False,  # compiled once per process
+    autoescape=False  # plain-text email body
+)
+_env.filters["money"] = lambda value: f"{value:,}"
+_template = _env.get_template("proposal.txt.j2")
+
+_MAX_WORDS = 120
+_HEADING = re.compile(r"^\s*(\*\*.*\*\*|#+ .*|[A-Za-z ]{3,40}:)\s*$")
+
+
+def _context(state):
+    plan = state["project_plan"]
+    return {
+        "client": state["client_name"],
+        "company": state.get("company") or "their organization",
+        "project": state["project_type"],
+        "requirements": ", ".join(state.get("requirements") or []) or "not detailed yet",
+        "timeline": state.get("timeline") or "8-12 weeks",
+        "budget": state.get("budget") or "not stated",
+        "hours": plan["total_estimated_hours"],
+        "complexity": plan["complexity"],
+        "cost": state["cost_estimate"]
+    }
+
+
+def paragraph_prompts(state):
+    """The two personalised sections, keyed by template variable; independent, so run together"""
+    c = _context(state)
+    rules = """- 2-4 sentences, 50-90 words, plain text
+- No greeting, heading, sign-off, price or placeholders"""
+    return {
+        "understanding": f"""Write the "Understanding Your Needs" paragraph of a proposal email.
+
+Client: {c['client']} ({c['company']})
+Project: {c['project']}
+Requirements: {c['requirements']}
+Timeline: {c['timeline']}
+Budget mentioned: {c['budget']}
+
+Restate in your own words what the client wants to achieve and why, referring to their specific requirements.
+{rules}
+
+Paragraph:""",
+        "business_value": f"""Write the "Business Value" paragraph of a proposal email.
+
+Client: {c['client']} ({c['company']})
+Project: {c['project']}
+Requirements: {c['requirements']}
+Scope: {c['hours']} hours, {c['complexity']} complexity
+
+Explain concretely why this project is worth the investment for this client: time saved, revenue gained or risk reduced.
+{rules}
+
+Paragraph:"""
+    }
+
+
+def default_paragraph(section, state):
+    """Used when the LLM call for a section fails"""
+    if section == "understanding":
+        requirements = state.get("requirements") or []
+        first = requirements[0] if requirements else "custom functionality"
+        return (f"Based on your inquiry, we understand you need a {state['project_type']} with specific "
+                f"requirements including {first}. We have experience delivering projects of this complexity and scope.")
+    return ("This investment covers comprehensive development, rigorous testing and deployment support. "
+            "We focus on delivering long-term value and making sure your system is maintainable and scalable.")
+
+
+def clean_paragraph(text):
+    """One plain paragraph from model output: no headings, quotes or run-on length; "" if unusable"""
+    lines = [l.strip() for l in (text or "").strip().splitlines() if l.strip()]
+    lines = [l for l in lines if not _HEADING.match(l)]
+    paragraph = " ".join(lines).strip().strip('"').strip()
+    if paragraph.startswith(("{", "Dear ")):
+        return ""  # the model answered a different question
+    words = paragraph.split()
+    if len(words) > _MAX_WORDS:
+        cut = " ".join(words[:_MAX_WORDS])
+        end = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "))
+        paragraph = cut[:end + 1] if end > 0 else cut + "..."
+    return paragraph
+
+
+def proposal_frame(state):
+    """The rendered letter split around its two paragraphs: ``(head, middle, tail)``.
+
+    Lets the node stream the letter in reading order while the paragraphs are
+    still being generated.
+    """
+    slots = ("\x00understanding\x00", "\x00business_value\x00")
+    text = render_proposal(state, *slots)
+    head, rest = text.split(slots[0])
+    middle, tail = rest.split(slots[1])
+    return head, middle, tail
+
+
+def render_proposal(state, understanding, business_value):
+    plan = state["project_plan"]
+    return _template.render(
+        client_name=state["client_name"],
+        company=state.get("company"),
+        project_type=state["project_type"],
+        phases=plan["phases"],
+        total_hours=plan["total_estimated_hours"],
+        complexity=plan["complexity"],
+        cost=state["cost_estimate"],
+        timeline=state.get("timeline") or "8-12 weeks",
+        understanding=understanding,
+        business_value=business_value
+    ).strip()
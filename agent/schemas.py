@@ -0,0 +1,93 @@
+"""Pydantic models for the JSON each LLM node must return"""
+from typing import List, Literal, Optional
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+
+
+class NodeOutput(BaseModel):
+    # Models add chatter fields ("notes", "email") we neither need nor reject
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
+
+
+def _as_list(value):
+    """Models sometimes answer a list field with one comma-separated string"""
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(",") if part.strip()]
+    return value
+
+
+def _whole_number(value):
+    if isinstance(value, float):
+        return round(value)
+    if isinstance(value, str) and value.strip().replace(".", "", 1).isdigit():
+        return round(float(value))
+    return value
+
+
+class ClassificationOutput(NodeOutput):
+    is_valid: bool
+    confidence: float = Field(ge=0, le=1)
+    reason: str = "No reason provided"
+
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def _percent_to_fraction(cls, value):
+        # "confidence": 85 means 85%; a fractional value above 1 is just out of range
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and 1 < value <= 100 and value == int(value):
+            return value / 100
+        return value
+
+
+class ExtractionOutput(NodeOutput):
+    client_name: Optional[str] = None  # filled from the sender address when missing
+    company: Optional[str] = None
+    email: Optional[str] = None
+    project_type: str = Field(min_length=1)
+    requirements: List[str] = Field(min_length=1)
+    timeline: Optional[str] = "To be determined"
+    budget: Optional[str] = "Flexible"
+
+    _split_requirements = field_validator("requirements", mode="before")(_as_list)
+
+
+class FusedOutput(ClassificationOutput):
+    """Classification plus, for valid inquiries, every extraction field"""
+    client_name: Optional[str] = None
+    company: Optional[str] = None
+    email: Optional[str] = None
+    project_type: Optional[str] = None
+    requirements: Optional[List[str]] = None
+    timeline: Optional[str] = None
+    budget: Optional[str] = None
+
+    _split_requirements = field_validator("requirements", mode="before")(_as_list)
+
+    @model_validator(mode="after")
+    def _extraction_when_valid(self):
+        if self.is_valid:
+            missing = [f for f in ("client_name", "project_type", "requirements") if not getattr(self, f)]
+            if missing:
+                raise ValueError(f"valid inquiry is missing {', '.join(missing)}")
+        return self
+
+
+class PlanPhase(NodeOutput):
+    name: str = Field(min_length=1)
+    duration: str = "TBD"
+    hours: Optional[int] = None
+    tasks: List[str] = []
+
+    _round_hours = field_validator("hours", mode="before")(_whole_number)
+    _split_tasks = field_validator("tasks", mode="before")(_as_list)
+
+
+class ProjectPlan(NodeOutput):
+    complexity: Literal["simple", "medium", "complex"]
+    total_estimated_hours: int = Field(gt=0)
+    phases: List[PlanPhase] = Field(min_length=1)
+
+    _round_total = field_validator("total_estimated_hours", mode="before")(_whole_number)
+
+    @field_validator("complexity", mode="before")
+    @classmethod
+    def _lower(cls, value):
+        return value.strip().lower() if isinstance(value, str) else value
@@ -12,6 +12,19 @@ class EmailAgentState(TypedDict):
     email_subject: str
     email_body: str
     thread_id: str
+    message_id: Optional[str]  # the email's own Message-ID header
+    references: Optional[List[str]]  # Message-IDs it replies to (References + In-Reply-To)
+    coalesced: Optional[List[dict]]  # {"id", "message_id"} of thread messages folded into this run
+    email_headers: Optional[dict]  # lower-cased bulk-mail headers used by the prefilter
+    fingerprint: Optional[int]  # SimHash of the body, set when dedup is enabled
+    duplicate_of: Optional[str]  # email_id of the near-identical inquiry this reuses
+    prefilter_score: Optional[float]  # local P(inquiry), drives the "prefilter" speculation policy
+    batch_verdict: Optional[dict]  # {is_valid, confidence, reason} from a multi-email classify prompt
+    batch_usage: Optional[dict]  # this email's share of that prompt's LLM usage
+    email_body_clean: Optional[str]  # body minus quoted history, signature and footers
+    token_counts: Optional[dict]  # approximate body tokens: original, normalized, per prompt
+    timings: Optional[dict]  # seconds per node, plus queue_wait and total
+    usage: Optional[dict]  # per node: LLM calls, tokens, llm_seconds, cache hits, fallbacks, retries
     
     # Extracted data
     client_name: Optional[str]
@@ -29,6 +42,7 @@ class EmailAgentState(TypedDict):
     # Control flags
     is_valid_inquiry: bool
     confidence_score: float
+    classified_by: Optional[str]  # "prefilter" or "llm"; None if classification failed
     needs_human_review: bool
     current_step: str
     error: Optional[str]
@@ -1,10 +1,16 @@
 """API routes"""
+from typing import Optional
 from fastapi import APIRouter, HTTPException
-from integrations.standard_email import StandardEmailService
+from fastapi.responses import StreamingResponse
+from integrations.email_factory import get_email_service
 from integrations.storage import StorageService
+from app.services.ingestion_service import process_inbox, resume_run
+from app.services.event_broker import broker
+from app.schemas import ProposalSchema, ApprovalRequest, BatchApprovalRequest
 from agent.graph import EmailAgentGraph
-from integrations.llm_wrapper import UnifiedLLM
-from app.schemas import ProposalSchema, ApprovalRequest
+from agent.checkpointing import get_checkpointer
+from integrations.provider_registry import get_llm
+from monitoring.metrics import metrics
 
 router = APIRouter()
 
@@ -12,44 +18,7 @@ router = APIRouter()
 async def check_emails():
     """Process unread emails"""
     try:
-        gmail = StandardEmailService()
-        llm = UnifiedLLM()
-        agent = EmailAgentGraph(llm)
-        storage = StorageService()
-        
-        emails = await gmail.get_unread_emails()
-        results = []
-        
-        for email in emails:
-            try:
-                # Skip processed emails
-                if storage.is_email_processed(email["id"]):
-                    print(f"[DEBUG] Skipping already processed email: {email['id']}")
-                    continue
-                    
-                state = await agent.process_email(email)
-                
-                if not state["is_valid_inquiry"]:
-                    await gmail.mark_as_read(email["id"])
-                    continue
-                
-                # Save to database
-                client_id = storage.create_client(state)
-                draft_id = await gmail.create_draft(
-                    to=state["email_from"],
-                    subject=f"{state['project_type']} Proposal",
-                    body=state["proposal_text"],
-                    thread_id=state["thread_id"]
-                )
-                proposal_id = storage.create_proposal(client_id, state, draft_id)
-                
-                await gmail.mark_as_read(email["id"])
-                results.append({"proposal_id": proposal_id, "status": "success"})
-            except Exception as e:
-                print(f"[ERROR] Failed to process email {email.get('id', 'unknown')}: {e}")
-                # Continue processing other emails even if one fails
-                continue
-        
+        results = await process_inbox()
         return {"processed": len(results)}
     except Exception as e:
         print(f"[ERROR] Failed to check emails: {e}")
@@ -65,7 +34,7 @@ async def get_pending_proposals():
 @router.post("/proposals/{proposal_id}/approve")
 async def approve_proposal(proposal_id: int, request: ApprovalRequest):
     storage = StorageService()
-    gmail = StandardEmailService()
+    gmail = get_email_service()
     
     proposal = storage.get_proposal(proposal_id)
     if not proposal:
@@ -79,7 +48,7 @@ async def approve_proposal(proposal_id: int, request: ApprovalRequest):
         if client:
             await gmail.send_email(
                 to=client.email,
-                subject=f"Proposal for {client.project_type}",
+                subject=f"Proposal for {storage.proposal_details(proposal, client)['project_type']}",
                 body=proposal.proposal_text
             )
             
@@ -88,3 +57,101 @@ async def approve_proposal(proposal_id: int, request: ApprovalRequest):
     else:
         storage.reject_proposal(proposal_id)
         return {"message": "Proposal rejected"}
+
+
+@router.post("/proposals/approve-batch")
+async def approve_proposals_batch(request: BatchApprovalRequest):
+    """Approve several proposals and send them concurrently over pooled SMTP sessions"""
+    storage = StorageService()
+    gmail = get_email_service()
+
+    approved, outgoing = [], []
+    for proposal_id in request.proposal_ids:
+        proposal = storage.get_proposal(proposal_id)
+        if not proposal:
+            continue
+        client = storage.get_client(proposal.client_id)
+        if not client:
+            continue
+        storage.approve_proposal(proposal_id)
+        approved.append(proposal_id)
+        outgoing.append({
+            "to": client.email,
+            "subject": f"Proposal for {storage.proposal_details(proposal, client)['project_type']}",
+            "body": proposal.proposal_text
+        })
+
+    errors = await gmail.send_many(outgoing)
+    sent, failed = [], []
+    for proposal_id, error in zip(approved, errors):
+        if error is None:
+            storage.mark_sent(proposal_id)
+            sent.append(proposal_id)
+        else:
+            print(f"[ERROR] Failed to send proposal {proposal_id}: {error}")
+            failed.append({"proposal_id": proposal_id, "error": str(error)})
+    return {"sent": sent, "failed": failed}
+
+
+@router.get("/events")
+async def stream_events(email_id: Optional[str] = None):
+    """Server-Sent Events: node transitions and proposal tokens for in-flight emails"""
+    return StreamingResponse(
+        broker.sse(email_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/admin/runs")
+async def list_stuck_runs():
+    """Agent runs with checkpoints that never reached storage (failed or interrupted)"""
+    checkpointer = await get_checkpointer()
+    if checkpointer is None:
+        raise HTTPException(400, "Agent checkpoints are disabled")
+    agent = EmailAgentGraph(await get_llm(), checkpointer=checkpointer)
+    return await agent.pending_runs()
+
+
+@router.post("/admin/runs/{email_id:path}/resume")
+async def resume_stuck_run(email_id: str):
+    """Resume a run from its last completed node and persist the result"""
+    try:
+        result = await resume_run(email_id)
+    except Exception as e:
+        print(f"[ERROR] Failed to resume run {email_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error resuming run: {str(e)}")
+    if result is None:
+        raise HTTPException(404, "No checkpointed run for this email")
+    return result
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """In-process counters, gauges and latency percentiles"""
+    return metrics.snapshot()
+
+
+@router.get("/metrics/nodes")
+async def get_node_metrics():
+    """Per-node p50/p95/p99 (seconds, LLM seconds, tokens) and counters over the sliding window"""
+    snapshot = metrics.snapshot("node.")
+    nodes = {}
+    for section in ("latency", "counters"):
+        for key, value in snapshot[section].items():
+            _, node, field = key.split(".", 2)
+            nodes.setdefault(node, {})[field] = value
+    return {"nodes": nodes, "pipeline": metrics.snapshot("pipeline.")["latency"]}
+
+
+@router.get("/proposals/{proposal_id}/metrics")
+async def get_proposal_metrics(proposal_id: int):
+    """Timings and LLM usage recorded when this proposal was generated"""
+    storage = StorageService()
+    try:
+        run = storage.get_run_metrics(proposal_id)
+    finally:
+        storage.close()
+    if run is None:
+        raise HTTPException(404, "No metrics recorded for this proposal")
+    return run
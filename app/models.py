@@ -1,5 +1,5 @@
 """Database models"""
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, create_engine
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, Float, create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -35,6 +35,99 @@ class Proposal(Base):
     sent_at = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class SyncCursor(Base):
+    """Per-mailbox incremental sync position (IMAP UIDVALIDITY + last UID, Gmail historyId)"""
+    __tablename__ = "sync_cursors"
+    id = Column(Integer, primary_key=True)
+    source = Column(String(255), unique=True)
+    validity = Column(String(64))
+    position = Column(String(64))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class PendingFlag(Base):
+    """Mark-as-read updates queued but not yet flushed to the mail server"""
+    __tablename__ = "pending_flags"
+    id = Column(Integer, primary_key=True)
+    source = Column(String(255), index=True)
+    msg_id = Column(String(255))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class FailedMessage(Base):
+    """A fetched message whose run failed; refetched by later polls until it succeeds or runs out of attempts"""
+    __tablename__ = "failed_messages"
+    id = Column(Integer, primary_key=True)
+    source = Column(String(255), index=True)
+    msg_id = Column(String(255))
+    attempts = Column(Integer, default=0)
+    error = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ClassificationRecord(Base):
+    """Inquiry/not-inquiry outcome per email; training data for the agent prefilter"""
+    __tablename__ = "classification_records"
+    id = Column(Integer, primary_key=True)
+    email_id = Column(String(255), unique=True)
+    sender = Column(String(255))
+    subject = Column(Text)
+    body = Column(Text)
+    is_inquiry = Column(Boolean)
+    confidence = Column(Float)
+    classified_by = Column(String(20))  # "llm" or "prefilter"
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class EmailFingerprint(Base):
+    """SimHash of a processed inquiry plus the pipeline output it produced.
+
+    The 64-bit hash is split into four indexed 16-bit bands so near-duplicate
+    lookup is a handful of index probes rather than a table scan.
+    """
+    __tablename__ = "email_fingerprints"
+    id = Column(Integer, primary_key=True)
+    email_id = Column(String(255), unique=True)
+    client_id = Column(Integer, index=True)
+    sender = Column(String(255))
+    simhash = Column(Integer)
+    band0 = Column(Integer, index=True)
+    band1 = Column(Integer, index=True)
+    band2 = Column(Integer, index=True)
+    band3 = Column(Integer, index=True)
+    pipeline_state = Column(Text)  # JSON: extraction fields, project_plan, cost_estimate
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class RunMetrics(Base):
+    """Per-node timings and LLM usage of one processed email (proposal_id set for inquiries)"""
+    __tablename__ = "run_metrics"
+    id = Column(Integer, primary_key=True)
+    email_id = Column(String(255), unique=True)
+    proposal_id = Column(Integer, index=True)
+    total_seconds = Column(Float)
+    timings = Column(Text)  # JSON: {node: seconds, "queue_wait": s, "total": s}
+    usage = Column(Text)  # JSON: {node: {calls, prompt_tokens, completion_tokens, ...}}
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ThreadMessage(Base):
+    """A processed message and the conversation it belongs to (resolves replies with truncated References)"""
+    __tablename__ = "thread_messages"
+    id = Column(Integer, primary_key=True)
+    email_id = Column(String(255), unique=True)
+    message_id = Column(String(255), index=True)
+    thread_id = Column(String(255), index=True)
+    client_id = Column(Integer, index=True)  # set when the thread produced or updated a client
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ProposalInquiry(Base):
+    """The inquiry a proposal answers; the client row only keeps its latest inquiry's details"""
+    __tablename__ = "proposal_inquiries"
+    id = Column(Integer, primary_key=True)
+    proposal_id = Column(Integer, unique=True)
+    thread_id = Column(String(255), index=True)
+    company = Column(String(255))
+    project_type = Column(String(255))
+    requirements = Column(Text)  # JSON list
+    timeline = Column(String(100))
+    budget = Column(String(100))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 engine = create_engine("sqlite:///./copilot.db")
 SessionLocal = sessionmaker(bind=engine)
 
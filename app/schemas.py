@@ -25,6 +25,9 @@ class ProposalSchema(BaseModel):
 class ApprovalRequest(BaseModel):
     approved: bool
 
+class BatchApprovalRequest(BaseModel):
+    proposal_ids: List[int]
+
 class EmailSchema(BaseModel):
     id: str
     from_: str
@@ -0,0 +1,60 @@
+"""In-process pub/sub for live pipeline events (node transitions, proposal tokens)"""
+import asyncio
+import json
+import time
+
+
+class EventBroker:
+    """Fan-out of event dicts to every subscriber queue.
+
+    Publishing never blocks the pipeline: a subscriber that falls more than
+    ``max_queue`` events behind loses its oldest events.
+    """
+
+    def __init__(self, max_queue=1000):
+        self.max_queue = max_queue
+        self._subscribers = set()
+
+    @property
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def publish(self, event_type, **data):
+        if not self._subscribers:
+            return
+        event = {"type": event_type, "ts": time.time(), **data}
+        for queue in list(self._subscribers):
+            if queue.full():
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(event)
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    async def sse(self, email_id=None, keepalive=15.0):
+        """Yield Server-Sent Events frames, optionally only for one email"""
+        queue = self.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"  # comment frame keeps proxies from closing the stream
+                    continue
+                if email_id and event.get("email_id") not in (None, email_id):
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(queue)
+
+
+broker = EventBroker()
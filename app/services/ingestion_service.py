@@ -0,0 +1,272 @@
+"""Inbox ingestion: fetch new mail and run it through the agent"""
+import asyncio
+import time
+from typing import Literal
+from pydantic_settings import BaseSettings
+from integrations.email_factory import get_email_service
+from integrations.storage import StorageService
+from integrations.flag_queue import FlagUpdateQueue
+from integrations.provider_registry import get_llm
+from agent.graph import EmailAgentGraph
+from agent.checkpointing import checkpointer_session
+from agent.batch_classify import classify_emails, config as batch_config
+from integrations.mail_threads import resolve_threads, coalesce, config as thread_config
+from app.services.event_broker import broker
+
+
+class IngestionConfig(BaseSettings):
+    # "concurrent" runs several emails through the agent at once; storage writes stay sequential
+    PROCESSING_MODE: Literal["sequential", "concurrent"] = "concurrent"
+    INGEST_MAX_EMAILS: int = 5  # emails fetched per poll
+    INGEST_MAX_ATTEMPTS: int = 5  # polls that retry a failing email before it is left unread for a human
+    # Emails in flight per LLM provider; a local model serialises on one GPU anyway
+    CONCURRENCY_GEMINI: int = 8
+    CONCURRENCY_LOCAL: int = 1
+    CONCURRENCY_MOCK: int = 20
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = IngestionConfig()
+
+# The route and the IDLE listener can both trigger a run; never let them overlap
+_inbox_lock = asyncio.Lock()
+
+_provider_slots = {}
+
+
+def _slots_for(provider):
+    """One semaphore per provider, shared by every run in the process"""
+    provider = str(provider).strip().lower()
+    if provider not in _provider_slots:
+        limit = getattr(config, f"CONCURRENCY_{provider.upper()}", 1)
+        _provider_slots[provider] = asyncio.Semaphore(max(limit, 1))
+    return _provider_slots[provider]
+
+
+async def _run_agent(agent, email, slots):
+    """Run one email through the graph; returns the state or the exception it raised"""
+    queued = time.perf_counter()
+    async with slots:
+        try:
+            return await agent.process_email(email, queue_wait=time.perf_counter() - queued)
+        except Exception as e:
+            return e
+
+
+async def process_inbox():
+    """Process unread emails once; returns one result dict per proposal created"""
+    results, _ = await _process_inbox()
+    return results
+
+
+async def poll_inbox():
+    """One poll for the IMAP IDLE listener; True while more mail than INGEST_MAX_EMAILS is waiting"""
+    _, more_pending = await _process_inbox()
+    return more_pending
+
+
+async def _process_inbox():
+    """Returns ``(results, more_pending)``"""
+    async with _inbox_lock, checkpointer_session() as checkpointer:
+        gmail = get_email_service()
+        llm = await get_llm()
+        # Checkpointed per email, so a failure resumes at the failed node next poll
+        agent = EmailAgentGraph(
+            llm,
+            checkpointer=checkpointer,
+            # Spare when another email could still start right now
+            spare_capacity=lambda: not _slots_for(llm.provider).locked()
+        )
+        storage = StorageService()
+        flags = FlagUpdateQueue(gmail, storage)
+        tasks = None
+
+        try:
+            # Dedup on headers alone so processed messages never have their body downloaded
+            emails = await gmail.get_unread_emails(
+                max_results=config.INGEST_MAX_EMAILS,
+                triage=lambda e: not storage.is_email_processed(e["id"])
+            )
+            emails = await _with_retries(gmail, storage, await _unfinished_runs(agent, storage) + emails)
+            emails = _group_threads(storage, emails)
+            results = []
+            if batch_config.CLASSIFY_BATCH_SIZE > 1 and not agent.fused and emails:
+                # One classify prompt per K emails; the graph applies the verdicts
+                verdicts, usage = await classify_emails(llm, emails, slots=_slots_for(llm.provider))
+                for email in emails:
+                    email["batch_verdict"] = verdicts.get(email["id"])
+                    email["batch_usage"] = usage.get(email["id"])
+            broker.publish("run_started", emails=[{"email_id": e["id"], "subject": e["subject"]} for e in emails])
+
+            if config.PROCESSING_MODE == "concurrent":
+                # LLM work fans out; each task is awaited in fetch order so the DB
+                # session, drafts and flags are only ever touched by this coroutine
+                slots = _slots_for(llm.provider)
+                tasks = [asyncio.create_task(_run_agent(agent, email, slots)) for email in emails]
+
+            for i, email in enumerate(emails):
+                try:
+                    if tasks is not None:
+                        state = await tasks[i]
+                        if isinstance(state, Exception):
+                            raise state
+                    else:
+                        # Skip processed emails
+                        if storage.is_email_processed(email["id"]):
+                            print(f"[DEBUG] Skipping already processed email: {email['id']}")
+                            continue
+                        state = await agent.process_email(email)
+
+                    result = await _commit(gmail, storage, flags, email, state)
+                    await _clear_run(agent, email["id"])
+                    if result:
+                        results.append(result)
+                    broker.publish("email_done", email_id=email["id"], proposal_id=result and result["proposal_id"])
+                except Exception as e:
+                    print(f"[ERROR] Failed to process email {email.get('id', 'unknown')}: {e}")
+                    broker.publish("email_failed", email_id=email["id"], error=str(e))
+                    await _record_failure(agent, gmail, storage, email, e)
+                    # Continue processing other emails even if one fails
+                    continue
+
+            await flags.flush()
+            # Advance past everything fetched this poll so the next one starts at UID n+1;
+            # failed emails are in failed_messages and get refetched by ID
+            await gmail.commit_sync_cursor()
+            broker.publish("run_finished", processed=len(results))
+            return results, gmail.more_pending
+        finally:
+            for task in tasks or ():
+                task.cancel()
+            flags.close()
+            storage.close()
+
+
+async def resume_run(email_id):
+    """Finish one checkpointed run and persist it the way a poll would.
+
+    Returns the result dict, ``{"status": "not_inquiry"}``, or None if no run exists.
+    """
+    async with _inbox_lock, checkpointer_session() as checkpointer:
+        if checkpointer is None:
+            raise RuntimeError("Agent checkpoints are disabled (AGENT_CHECKPOINTS=false)")
+        gmail = get_email_service()
+        agent = EmailAgentGraph(await get_llm(), checkpointer=checkpointer)
+        email = await agent.run_email(email_id)
+        if email is None:
+            return None
+
+        storage = StorageService()
+        flags = FlagUpdateQueue(gmail, storage)
+        try:
+            state = await agent.process_email(email)
+            result = await _commit(gmail, storage, flags, email, state)
+            await flags.flush()
+            await _clear_run(agent, email_id)
+            broker.publish("email_done", email_id=email_id, proposal_id=result and result["proposal_id"])
+            return result or {"status": "not_inquiry"}
+        finally:
+            flags.close()
+            storage.close()
+
+
+async def _unfinished_runs(agent, storage):
+    """Emails of checkpointed runs that never got committed (a failed node, a crash), resumed first"""
+    if agent.checkpointer is None:
+        return []
+    emails = []
+    for run in await agent.pending_runs():
+        if storage.is_email_processed(run["email_id"]):
+            # Stored, but the checkpoint cleanup after the commit failed
+            await _clear_run(agent, run["email_id"])
+            continue
+        email = await agent.run_email(run["email_id"])
+        if email:
+            emails.append(email)
+    if emails:
+        print(f"[DEBUG] Resuming {len(emails)} unfinished run(s)")
+    return emails
+
+
+async def _with_retries(gmail, storage, emails):
+    """Prepend emails whose run failed on an earlier poll, fetched again by ID"""
+    source = gmail.sync_source
+    unique = {}
+    for email in emails:
+        unique.setdefault(email["id"], email)  # a resumed run may also have been fetched again
+    emails = list(unique.values())
+    # Messages folded into a resumed run are committed with it, not fetched on their own
+    fetched = set(unique) | {m["id"] for email in emails for m in email.get("coalesced", ())}
+    retry_ids = [i for i in storage.get_failed_messages(source) if i not in fetched]
+    if not retry_ids:
+        return emails
+    retried = await gmail.fetch_emails(retry_ids)
+    found = {email["id"] for email in retried}
+    missing = [i for i in retry_ids if i not in found]
+    if missing:
+        print(f"[ERROR] Failed emails could not be fetched again (deleted or unavailable), not retrying: {missing}")
+        storage.clear_failed_messages(source, missing)
+    retried = [email for email in retried if not storage.is_email_processed(email["id"])]
+    print(f"[DEBUG] Retrying {len(retried)} email(s) that failed earlier")
+    return retried + emails
+
+
+async def _record_failure(agent, gmail, storage, email, error):
+    """Queue a failed email (and any messages coalesced into it) for the next poll"""
+    for message in [email, *email.get("coalesced", ())]:
+        if not storage.record_failed_message(gmail.sync_source, message["id"], error, config.INGEST_MAX_ATTEMPTS):
+            print(f"[ERROR] Giving up on email {message['id']} after {config.INGEST_MAX_ATTEMPTS} "
+                  f"attempts; it stays unread in the mailbox")
+            # Or the next poll would resume its checkpointed run all over again
+            await _clear_run(agent, message["id"])
+
+
+def _group_threads(storage, emails):
+    """Resolve each email's conversation, then fold every thread of the poll into one email"""
+    if not emails:
+        return emails
+    referenced = {ref for email in emails for ref in email.get("references") or ()}
+    resolve_threads(emails, storage.thread_ids_for(referenced))
+    return coalesce(emails) if thread_config.THREAD_COALESCE else emails
+
+
+async def _clear_run(agent, email_id):
+    """Checkpoint cleanup must not fail an email whose result is already stored"""
+    try:
+        await agent.clear_run(email_id)
+    except Exception as e:
+        print(f"[ERROR] Failed to clear checkpoints for {email_id}: {e}")
+
+
+async def _commit(gmail, storage, flags, email, state):
+    """Persist one processed email; returns its result dict, or None when it was not an inquiry"""
+    storage.record_classification(state)
+    # The run covered every message coalesced into this one, so they are flagged with it
+    thread = [email, *email.get("coalesced", ())]
+    storage.clear_failed_messages(gmail.sync_source, [message["id"] for message in thread])
+    if not state["is_valid_inquiry"]:
+        storage.save_run_metrics(state)
+        storage.record_thread_messages(state["thread_id"], thread)
+        for message in thread:
+            await flags.add(message["id"])
+        return None
+
+    # Save to database; a follow-up updates its client and replaces the thread's pending proposal
+    client_id = storage.create_client(state)
+    storage.supersede_proposals(client_id, state["thread_id"])
+    storage.record_thread_messages(state["thread_id"], thread, client_id)
+    storage.save_fingerprint(state, client_id)
+    draft_id = await gmail.create_draft(
+        to=state["email_from"],
+        subject=f"{state['project_type']} Proposal",
+        body=state["proposal_text"],
+        thread_id=state["thread_id"]
+    )
+    proposal_id = storage.create_proposal(client_id, state, draft_id)
+    storage.save_run_metrics(state, proposal_id)
+
+    for message in thread:
+        await flags.add(message["id"])
+    return {"proposal_id": proposal_id, "status": "success"}
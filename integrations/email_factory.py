@@ -0,0 +1,28 @@
+"""Pick the email backend (IMAP, Gmail API or offline replay) from config"""
+from typing import Literal
+from pydantic_settings import BaseSettings
+
+
+class EmailBackendConfig(BaseSettings):
+    # "replay" runs the full pipeline against a local mailbox file, no server needed
+    EMAIL_BACKEND: Literal["imap", "gmail", "replay"] = "imap"
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = EmailBackendConfig()
+
+
+def get_email_service(backend=None):
+    """Build the configured email service; backends are imported lazily so each
+    only needs its own credentials/dependencies"""
+    backend = backend or config.EMAIL_BACKEND
+    if backend == "gmail":
+        from integrations.gmail_mcp import GmailMCP
+        return GmailMCP()
+    if backend == "replay":
+        from integrations.replay_email import ReplayEmailService
+        return ReplayEmailService()
+    from integrations.standard_email import StandardEmailService
+    return StandardEmailService()
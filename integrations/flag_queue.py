@@ -0,0 +1,91 @@
+"""Write-behind queue that batches mark-as-read flag updates"""
+import asyncio
+import time
+from pydantic_settings import BaseSettings
+
+
+class FlagQueueConfig(BaseSettings):
+    FLAG_FLUSH_SIZE: int = 50
+    FLAG_FLUSH_INTERVAL: float = 10.0  # seconds
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = FlagQueueConfig()
+
+
+class FlagUpdateQueue:
+    """Collects message IDs and flushes them in one call to ``service.mark_many_as_read``.
+
+    A flush happens once ``max_batch`` IDs are queued, or ``max_delay``
+    seconds after the oldest one was, whether or not more arrive (a timer
+    task). Every queued ID is also written to the ``pending_flags`` table,
+    so updates that were queued when the process died are flushed by the
+    next queue created for the same mailbox. Call ``close()`` when done.
+    """
+
+    def __init__(self, service, storage, max_batch=None, max_delay=None):
+        self.service = service
+        self.storage = storage
+        self.source = service.sync_source
+        self.max_batch = max_batch or config.FLAG_FLUSH_SIZE
+        self.max_delay = max_delay if max_delay is not None else config.FLAG_FLUSH_INTERVAL
+        self._pending = storage.get_pending_flags(self.source)
+        self._oldest = time.monotonic() if self._pending else None
+        self._timer = None
+        self._lock = asyncio.Lock()
+        if self._pending:
+            print(f"[DEBUG] Recovered {len(self._pending)} pending flag update(s) for {self.source}")
+            self._arm()
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def add(self, msg_id):
+        self.storage.add_pending_flag(self.source, msg_id)
+        self._pending.append(str(msg_id))
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if len(self._pending) >= self.max_batch or time.monotonic() - self._oldest >= self.max_delay:
+            await self.flush()
+        else:
+            self._arm()
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            batch = list(dict.fromkeys(self._pending))
+            try:
+                await self.service.mark_many_as_read(batch)
+            except Exception as e:
+                # Rows stay in pending_flags; the timer, the next flush or the next run retries them
+                print(f"[ERROR] Flag flush failed for {len(batch)} message(s): {e}")
+                self._oldest = time.monotonic()
+            else:
+                self.storage.clear_pending_flags(self.source, batch)
+                flushed = set(batch)
+                self._pending = [m for m in self._pending if m not in flushed]
+                self._oldest = time.monotonic() if self._pending else None
+        self._arm()
+
+    def close(self):
+        """Stop the timer; IDs still queued stay in pending_flags for the next queue"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _arm(self):
+        """Start the age timer for the oldest queued ID, unless it is running or nothing is queued"""
+        if self._timer is not None or not self._pending:
+            return
+        try:
+            self._timer = asyncio.get_running_loop().create_task(self._flush_when_due())
+        except RuntimeError:
+            pass  # no event loop (built outside one): the size check and explicit flushes still apply
+
+    async def _flush_when_due(self):
+        await asyncio.sleep(max(self._oldest + self.max_delay - time.monotonic(), 0))
+        self._timer = None
+        await self.flush()
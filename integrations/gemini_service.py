@@ -1,5 +1,6 @@
 from langchain_google_genai import ChatGoogleGenerativeAI
 from pydantic_settings import BaseSettings
+from integrations.llm_cache import FallbackResponse
 
 class GeminiConfig(BaseSettings):
     GOOGLE_API_KEY: str = ""
@@ -11,14 +12,17 @@ class GeminiConfig(BaseSettings):
 config = GeminiConfig()
 
 class GeminiService:
+    model_name = "gemini-2.5-flash"
+    sampling = {"temperature": 0.3}
+
     def __init__(self):
         if not config.GOOGLE_API_KEY:
             raise ValueError("GOOGLE_API_KEY is required for Gemini Service")
             
         self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
+            model=self.model_name,
             google_api_key=config.GOOGLE_API_KEY,
-            temperature=0.3
+            **self.sampling
         )
 
     async def invoke(self, prompt: str) -> str:
@@ -33,9 +37,19 @@ class GeminiService:
                 raise  # Let nodes.py handle the intelligent name parsing fallback
             # Check prompt type to return valid JSON for other cases
             elif "Classify if this email" in prompt:
-                return '{"is_valid": true, "confidence": 0.5, "reason": "Fallback: Gemini API Error"}'
+                return FallbackResponse('{"is_valid": true, "confidence": 0.5, "reason": "Fallback: Gemini API Error"}')
             elif "Create a realistic project plan" in prompt:
-                return '{"complexity": "low","total_estimated_hours": 10,"phases": [{"name": "Phase 1","duration": "1 week","hours": 10,"tasks": ["Initial Consultation"]}]}'
+                return FallbackResponse('{"complexity": "low","total_estimated_hours": 10,"phases": [{"name": "Phase 1","duration": "1 week","hours": 10,"tasks": ["Initial Consultation"]}]}')
             elif "Write a professional" in prompt:
-                return f"Dear Client,\\n\\nThank you for your email. We are currently experiencing high demand on our AI servers. Please contact us directly to discuss your project.\\n\\nBest regards,\\nOttoMail (Fallback Mode)"
-            return '{"response": "Error in Gemini API"}'
+                return FallbackResponse(f"Dear Client,\\n\\nThank you for your email. We are currently experiencing high demand on our AI servers. Please contact us directly to discuss your project.\\n\\nBest regards,\\nOttoMail (Fallback Mode)")
+            return FallbackResponse('{"response": "Error in Gemini API"}')
+
+    async def warm_up(self):
+        """One tiny request so the HTTP client and auth are set up before real traffic"""
+        await self.llm.ainvoke("Reply with the single word OK.")
+
+    async def astream(self, prompt: str):
+        """Yield response text as Gemini produces it; errors propagate to the caller"""
+        async for chunk in self.llm.astream(prompt):
+            if chunk.content:
+                yield chunk.content
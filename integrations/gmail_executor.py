@@ -0,0 +1,74 @@
+"""Bounded thread pool for blocking googleapiclient calls"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from monitoring.metrics import metrics
+
+
+class GmailExecutor:
+    """Runs ``fn(service, *args)`` on a worker thread with its own Gmail service.
+
+    googleapiclient/httplib2 objects are not thread-safe, so every worker
+    lazily builds a private service via ``service_factory``. Callers beyond
+    ``max_pending`` wait for a slot instead of piling onto the queue.
+    """
+
+    def __init__(self, service_factory, max_workers=4, max_pending=64, timeout=30, name="gmail"):
+        self.service_factory = service_factory
+        self.timeout = timeout
+        self.name = name
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-io")
+        self._slots = None
+        self._max_pending = max_pending
+        self._queued = 0
+        self._lock = threading.Lock()
+
+    def _service(self):
+        service = getattr(self._local, "service", None)
+        if service is None:
+            service = self._local.service = self.service_factory()
+        return service
+
+    def _update_queue_gauge(self):
+        metrics.gauge(f"{self.name}.queue_depth", self._queued)
+
+    async def run(self, fn, *args, timeout=None):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_pending)
+        async with self._slots:
+            enqueued = time.monotonic()
+            claim = {"state": "queued"}
+            with self._lock:
+                self._queued += 1
+                self._update_queue_gauge()
+
+            def task():
+                with self._lock:
+                    if claim["state"] != "queued":
+                        return None  # caller already timed out; don't run stale work
+                    claim["state"] = "running"
+                    self._queued -= 1
+                    self._update_queue_gauge()
+                started = time.monotonic()
+                metrics.observe(f"{self.name}.queue_wait", started - enqueued)
+                try:
+                    return fn(self._service(), *args)
+                finally:
+                    metrics.observe(f"{self.name}.call_latency", time.monotonic() - started)
+
+            future = asyncio.get_running_loop().run_in_executor(self._pool, task)
+            try:
+                return await asyncio.wait_for(future, timeout or self.timeout)
+            except asyncio.TimeoutError:
+                metrics.incr(f"{self.name}.timeouts")
+                with self._lock:
+                    if claim["state"] == "queued":
+                        claim["state"] = "abandoned"
+                        self._queued -= 1
+                        self._update_queue_gauge()
+                raise
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
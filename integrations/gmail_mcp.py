@@ -6,13 +6,55 @@ from email.mime.text import MIMEText
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from pydantic_settings import BaseSettings
+from integrations.gmail_sync import GmailSyncEngine
+from integrations.gmail_executor import GmailExecutor
+from integrations.mime_parser import extract_gmail_body, BULK_HEADERS
+from integrations.mail_threads import thread_fields, get_header
 
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
 
+class GmailConfig(BaseSettings):
+    GMAIL_WORKERS: int = 4
+    GMAIL_CALL_TIMEOUT: float = 30.0
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = GmailConfig()
+
+_shared_executor = None
+
 class GmailMCP:
-    def __init__(self):
-        self.service = self._authenticate()
+    sync_source = "gmail:me"
+
+    def __init__(self, service=None):
+        global _shared_executor
+        if service is not None:
+            # A prebuilt service (e.g. from build_from_document + HttpMock) skips OAuth;
+            # it is a single object, so it gets a single worker
+            self.executor = GmailExecutor(lambda: service, max_workers=1, timeout=config.GMAIL_CALL_TIMEOUT)
+        else:
+            if _shared_executor is None:
+                creds = self._authenticate()
+                _shared_executor = GmailExecutor(
+                    lambda: self._build_service(creds),
+                    max_workers=config.GMAIL_WORKERS,
+                    timeout=config.GMAIL_CALL_TIMEOUT
+                )
+            self.executor = _shared_executor
+        self._pending_cursor = None
+        self.more_pending = False  # the last get_unread_emails left mail for the next poll
+
+    @staticmethod
+    def _build_service(creds):
+        """One service per worker thread: httplib2.Http is not thread-safe"""
+        http = AuthorizedHttp(creds, http=httplib2.Http(timeout=config.GMAIL_CALL_TIMEOUT))
+        return build('gmail', 'v1', http=http, cache_discovery=False)
     
     def _authenticate(self):
         creds_file = "credentials.json"
@@ -33,41 +75,71 @@ class GmailMCP:
             with open(token_file, 'wb') as f:
                 pickle.dump(creds, f)
         
-        return build('gmail', 'v1', credentials=creds)
-    
-    async def get_unread_emails(self, max_results=5):
-        results = self.service.users().messages().list(
-            userId='me',
-            q='is:unread in:inbox',
-            maxResults=max_results
-        ).execute()
-        
-        emails = []
-        for msg in results.get('messages', []):
-            email = self._get_email_details(msg['id'])
-            emails.append(email)
-        return emails
+        return creds
     
-    def _get_email_details(self, msg_id):
-        msg = self.service.users().messages().get(
-            userId='me', id=msg_id, format='full'
-        ).execute()
-        
+    async def get_unread_emails(self, max_results=5, triage=None):
+        """Fetch only mail added since the stored historyId, off the event loop"""
+        from integrations.storage import StorageService
+        storage = StorageService()
+        try:
+            cursor = storage.get_sync_cursor(self.sync_source)
+        finally:
+            storage.close()
+
+        history_id = cursor[1] if cursor else None
+        messages, new_history_id, failed = await self.executor.run(
+            lambda service: GmailSyncEngine(service).sync(history_id, max_results)
+        )
+        if failed:
+            # The cursor moves past them; the next poll fetches them by ID instead
+            storage = StorageService()
+            try:
+                for msg_id in failed:
+                    storage.add_failed_message(self.sync_source, msg_id, "messages.get failed during sync")
+            finally:
+                storage.close()
+        self._pending_cursor = new_history_id
+        # A full batch means the history delta was capped; the rest comes with the next sync
+        self.more_pending = len(messages) + len(failed) >= max_results
+        emails = [self._parse_message(msg) for msg in messages]
+        return [e for e in emails if triage is None or triage(e)]
+
+    async def fetch_emails(self, email_ids):
+        """messages.get for specific IDs (runs that failed on an earlier poll)"""
+        messages, _ = await self.executor.run(lambda service: GmailSyncEngine(service).batch_get(list(email_ids)))
+        return [self._parse_message(msg) for msg in messages]
+
+    async def commit_sync_cursor(self):
+        """Persist the historyId reached by the last get_unread_emails call"""
+        if not self._pending_cursor:
+            return
+        from integrations.storage import StorageService
+        storage = StorageService()
+        try:
+            storage.save_sync_cursor(self.sync_source, "history", self._pending_cursor)
+        finally:
+            storage.close()
+        self._pending_cursor = None
+
+    def _parse_message(self, msg):
         headers = {h['name']: h['value'] for h in msg['payload']['headers']}
         body = self._extract_body(msg['payload'])
         
         return {
-            'id': msg_id,
-            'from': headers.get('From', ''),
-            'subject': headers.get('Subject', ''),
+            'id': msg['id'],
+            # Header names keep the sender's case (Message-Id is as common as Message-ID)
+            'from': get_header(headers, 'From') or '',
+            'subject': get_header(headers, 'Subject') or '',
+            'message_id': get_header(headers, 'Message-ID') or '',
+            'headers': {k.lower(): v for k, v in headers.items() if k.lower() in BULK_HEADERS},
             'body': body,
+            **thread_fields(headers),
             'thread_id': msg['threadId']
         }
     
     def _extract_body(self, payload):
-        if 'body' in payload and 'data' in payload['body']:
-            return base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
-        return ""
+        # Walks payload.parts so multipart mail yields its text/plain part, not ""
+        return extract_gmail_body(payload)
     
     async def create_draft(self, to, subject, body, thread_id=None):
         message = MIMEText(body)
@@ -79,17 +151,51 @@ class GmailMCP:
         if thread_id:
             draft_body['message']['threadId'] = thread_id
         
-        draft = self.service.users().drafts().create(
-            userId='me', body=draft_body
-        ).execute()
+        draft = await self.executor.run(
+            lambda service: service.users().drafts().create(userId='me', body=draft_body).execute()
+        )
         return draft['id']
     
+    async def send_email(self, to, subject, body):
+        message = MIMEText(body)
+        message['to'] = to
+        message['subject'] = subject
+        raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
+        await self.executor.run(
+            lambda service: service.users().messages().send(userId='me', body={'raw': raw}).execute()
+        )
+
+    async def send_many(self, messages):
+        errors = []
+        for m in messages:
+            try:
+                await self.send_email(m["to"], m["subject"], m["body"])
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+        return errors
+
     async def send_draft(self, draft_id):
-        self.service.users().drafts().send(userId='me', body={'id': draft_id}).execute()
+        await self.executor.run(
+            lambda service: service.users().drafts().send(userId='me', body={'id': draft_id}).execute()
+        )
     
     async def mark_as_read(self, msg_id):
-        self.service.users().messages().modify(
-            userId='me',
-            id=msg_id,
-            body={'removeLabelIds': ['UNREAD']}
-        ).execute()
+        await self.executor.run(
+            lambda service: service.users().messages().modify(
+                userId='me',
+                id=msg_id,
+                body={'removeLabelIds': ['UNREAD']}
+            ).execute()
+        )
+
+    async def mark_many_as_read(self, msg_ids):
+        # batchModify accepts up to 1000 IDs per call
+        for i in range(0, len(msg_ids), 1000):
+            chunk = list(msg_ids[i:i + 1000])
+            await self.executor.run(
+                lambda service: service.users().messages().batchModify(
+                    userId='me',
+                    body={'ids': chunk, 'removeLabelIds': ['UNREAD']}
+                ).execute()
+            )
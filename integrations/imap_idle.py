@@ -0,0 +1,187 @@
+"""IMAP IDLE listener: push-driven ingestion with a polling fallback"""
+import asyncio
+import imaplib
+import re
+import select
+import ssl
+import time
+
+_NEW_MAIL = re.compile(rb"^\* \d+ (EXISTS|RECENT)\b", re.IGNORECASE)
+# Once a response line has started arriving, the rest of it must follow within this many seconds
+LINE_TIMEOUT = 30
+
+
+class IMAPIdleListener:
+    """Holds one dedicated IDLE session and awaits ``on_new_mail()`` on arrivals.
+
+    Servers drop IDLE after 30 minutes (RFC 2177 says 29), so the command is
+    re-issued every ``renew_after`` seconds. If the server does not advertise
+    IDLE the listener just calls ``on_new_mail()`` every ``poll_interval``.
+
+    ``on_new_mail()`` returns True when it handled a full batch and more mail
+    is waiting; it is then called again right away, since IDLE announces a
+    burst only once.
+    """
+
+    def __init__(self, on_new_mail, host, user, password, mailbox="INBOX",
+                 renew_after=25 * 60, poll_interval=60, connect=None):
+        self.on_new_mail = on_new_mail
+        self.host = host
+        self.user = user
+        self.password = password
+        self.mailbox = mailbox
+        self.renew_after = renew_after
+        self.poll_interval = poll_interval
+        # Injectable so the listener can be pointed at a local IMAP stand-in
+        self._connect_fn = connect or (lambda: imaplib.IMAP4_SSL(self.host))
+        self._stopped = False
+        # How often a blocked IDLE wakes up to check stop()
+        self.tick = 1.0
+
+    def stop(self):
+        self._stopped = True
+
+    async def run(self):
+        backoff = 5
+        while not self._stopped:
+            mail = None
+            try:
+                mail = await asyncio.to_thread(self._open)
+                backoff = 5
+                if "IDLE" in mail.capabilities:
+                    await self._idle_loop(mail)
+                else:
+                    print("[IDLE] Server lacks IDLE capability, falling back to polling")
+                    await self._poll_loop()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[IDLE] Listener error, reconnecting in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 300)
+            finally:
+                if mail is not None:
+                    await asyncio.to_thread(self._logout, mail)
+
+    def _open(self):
+        mail = self._connect_fn()
+        mail.login(self.user, self.password)
+        mail.select(self.mailbox)
+        return mail
+
+    def _logout(self, mail):
+        try:
+            mail.logout()
+        except Exception:
+            pass
+
+    async def _poll_loop(self):
+        while not self._stopped:
+            await self._dispatch()
+            await asyncio.sleep(self.poll_interval)
+
+    async def _idle_loop(self, mail):
+        # Catch anything that arrived while we were not listening
+        await self._dispatch()
+        while not self._stopped:
+            got_mail = await asyncio.to_thread(self._idle_once, mail)
+            if got_mail:
+                await self._dispatch()
+                # Mail that lands while the pipeline runs is not re-announced by IDLE;
+                # a NOOP surfaces it as an untagged EXISTS instead
+                while not self._stopped and await asyncio.to_thread(self._has_pending_exists, mail):
+                    await self._dispatch()
+
+    async def _dispatch(self):
+        while not self._stopped:
+            try:
+                more_pending = await self.on_new_mail()
+            except Exception as e:
+                print(f"[IDLE] New-mail handler failed: {e}")
+                return
+            if more_pending is not True:
+                return
+
+    def _has_pending_exists(self, mail):
+        mail.untagged_responses.pop("EXISTS", None)
+        mail.untagged_responses.pop("RECENT", None)
+        mail.noop()
+        return bool(mail.untagged_responses.pop("EXISTS", None) or mail.untagged_responses.pop("RECENT", None))
+
+    def _idle_once(self, mail):
+        """Run one IDLE command; returns True when new mail was announced"""
+        tag = mail._new_tag()
+        mail.send(tag + b" IDLE\r\n")
+
+        got_mail = False
+        while True:
+            line = self._read_line(mail, deadline=time.monotonic() + LINE_TIMEOUT)
+            if line is None or line.startswith(tag):
+                raise imaplib.IMAP4.error(f"IDLE rejected: {line!r}")
+            if line.startswith(b"+"):
+                break
+            if _NEW_MAIL.match(line):
+                got_mail = True
+
+        deadline = time.monotonic() + self.renew_after
+        while not got_mail and not self._stopped and time.monotonic() < deadline:
+            line = self._read_line(mail, deadline=min(deadline, time.monotonic() + self.tick))
+            if line is None:
+                continue
+            if _NEW_MAIL.match(line):
+                got_mail = True
+                break
+            if line.startswith(b"* BYE"):
+                raise imaplib.IMAP4.abort(line.decode(errors="replace"))
+
+        mail.send(b"DONE\r\n")
+        while True:
+            line = self._read_line(mail, deadline=time.monotonic() + LINE_TIMEOUT)
+            if line is None:
+                raise imaplib.IMAP4.abort("Timed out waiting for IDLE completion")
+            if _NEW_MAIL.match(line):
+                got_mail = True
+            if line.startswith(tag):
+                if b" OK" not in line.upper():
+                    raise imaplib.IMAP4.error(line.decode(errors="replace"))
+                return got_mail
+
+    def _read_line(self, mail, deadline):
+        """Read one response line through imaplib's reader, or None if none starts by ``deadline``.
+
+        Lines imaplib already buffered (e.g. an EXISTS that arrived with the
+        previous command's response) are returned first. The wait itself is a
+        select() on the socket: a socket timeout firing inside the buffered
+        reader would make the connection unreadable, so the timeout only
+        bounds a line that has started arriving.
+        """
+        if not self._buffered(mail):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            readable, _, _ = select.select([mail.sock], [], [], remaining)
+            if not readable:
+                return None
+        previous = mail.sock.gettimeout()
+        mail.sock.settimeout(LINE_TIMEOUT)
+        try:
+            line = mail.readline()
+        except TimeoutError:
+            raise imaplib.IMAP4.abort("Timed out reading an IDLE response line")
+        finally:
+            mail.sock.settimeout(previous)
+        if not line:
+            raise imaplib.IMAP4.abort("Connection closed during IDLE")
+        return line.rstrip(b"\r\n")
+
+    def _buffered(self, mail):
+        """True when response bytes can be read without waiting (imaplib's buffer or TLS's)"""
+        previous = mail.sock.gettimeout()
+        mail.sock.settimeout(0)
+        try:
+            # Non-blocking: returns what is buffered, reading the socket only if data is there
+            return bool(mail.file.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            mail.sock.settimeout(previous)
@@ -0,0 +1,165 @@
+"""Pooled, persistent IMAP sessions"""
+import imaplib
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+
+class IMAPConnectionPool:
+    """Keeps authenticated, INBOX-selected IMAP sessions alive between calls.
+
+    Sessions are health-checked with NOOP when they have been idle for a
+    while and transparently replaced when the server has dropped them.
+    """
+
+    def __init__(self, host, user, password, size=2, mailbox="INBOX",
+                 check_after=30, connect=None, timeout=30):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.size = size
+        self.mailbox = mailbox
+        self.check_after = check_after
+        self.timeout = timeout
+        # Factory is injectable so the pool can run against a local IMAP stand-in
+        self._connect_fn = connect or self._default_connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def _default_connect(self):
+        return imaplib.IMAP4_SSL(self.host, timeout=self.timeout)
+
+    def _open(self):
+        mail = self._connect_fn()
+        try:
+            mail.login(self.user, self.password)
+            mail.select(self.mailbox)
+            mail.uidvalidity = None
+            self.uidvalidity(mail)
+        except BaseException:
+            # A failed login must not leak the connected socket
+            self._discard(mail)
+            raise
+        with self._lock:
+            self._created += 1
+        print(f"[DEBUG] Opened IMAP session #{self._created} to {self.host}")
+        return mail
+
+    def uidvalidity(self, mail):
+        """UIDVALIDITY of the session's selected mailbox.
+
+        Taken from the SELECT response code, or a later untagged
+        ``OK [UIDVALIDITY n]`` if the server announces a change: RFC 3501
+        says STATUS should not be used on the selected mailbox.
+        """
+        _, data = mail.response("UIDVALIDITY")
+        if data and data[-1] is not None:
+            mail.uidvalidity = int(data[-1])
+        elif mail.uidvalidity is None:
+            # The server left it out of the SELECT response; ask once
+            status, data = mail.status(self.mailbox, "(UIDVALIDITY)")
+            if status != "OK":
+                raise imaplib.IMAP4.error(f"STATUS failed: {data}")
+            text = data[0].decode() if isinstance(data[0], bytes) else str(data[0])
+            mail.uidvalidity = int(text.split("UIDVALIDITY", 1)[1].strip(" )"))
+        return mail.uidvalidity
+
+    def _is_alive(self, mail):
+        try:
+            status, _ = mail.noop()
+            return status == "OK"
+        except (imaplib.IMAP4.error, OSError):
+            return False
+
+    def _discard(self, mail):
+        try:
+            mail.logout()
+        except Exception:
+            # logout() only closes the socket once the server answered LOGOUT
+            try:
+                mail.shutdown()
+            except Exception:
+                pass
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    mail, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._open()
+                if time.monotonic() - last_used < self.check_after or self._is_alive(mail):
+                    return mail
+                self._discard(mail)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, mail, broken=False):
+        try:
+            if broken:
+                self._discard(mail)
+            else:
+                self._idle.put((mail, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a session; it is dropped instead of returned if the call breaks it."""
+        mail = self.acquire()
+        try:
+            yield mail
+        except (imaplib.IMAP4.abort, OSError):
+            self.release(mail, broken=True)
+            raise
+        except BaseException:
+            self.release(mail)
+            raise
+        else:
+            self.release(mail)
+
+    def run(self, fn, retries=1):
+        """Run fn(mail) on a pooled session, reconnecting if the session was dead."""
+        for attempt in range(retries + 1):
+            try:
+                with self.connection() as mail:
+                    return fn(mail)
+            except (imaplib.IMAP4.abort, OSError):
+                if attempt == retries:
+                    raise
+                print("[DEBUG] IMAP session dropped, reconnecting...")
+
+    def close(self):
+        while True:
+            try:
+                mail, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(mail)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_imap_pool(host, user, password, **kwargs):
+    """Return the process-wide pool for this account, creating it on first use."""
+    key = (host, user)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = IMAPConnectionPool(host, user, password, **kwargs)
+            _pools[key] = pool
+        return pool
+
+
+def close_all_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
@@ -0,0 +1,160 @@
+"""Helpers for parsing raw IMAP FETCH responses and BODYSTRUCTURE trees"""
+import re
+
+
+class _Literal(bytes):
+    """Marks a value that arrived as an IMAP {n} literal (never an atom like NIL)."""
+
+
+def _segments(data):
+    """Flatten imaplib's list of bytes/tuples into text chunks and literals."""
+    for item in data:
+        if isinstance(item, tuple):
+            head, literal = item[0], item[1]
+            # Drop the trailing "{123}" marker; the literal follows it
+            yield re.sub(rb"\{\d+\}$", b"", head)
+            yield _Literal(literal)
+        elif item is not None:
+            yield item
+
+
+def _tokenize(data):
+    for seg in _segments(data):
+        if isinstance(seg, _Literal):
+            yield seg
+            continue
+        i, n = 0, len(seg)
+        while i < n:
+            c = seg[i:i + 1]
+            if c in b" \r\n":
+                i += 1
+            elif c in b"()":
+                yield c
+                i += 1
+            elif c == b'"':
+                j = i + 1
+                out = bytearray()
+                while j < n and seg[j:j + 1] != b'"':
+                    if seg[j:j + 1] == b"\\":
+                        j += 1
+                    out += seg[j:j + 1]
+                    j += 1
+                yield _Literal(bytes(out))
+                i = j + 1
+            else:
+                j = i
+                depth = 0
+                while j < n:
+                    ch = seg[j:j + 1]
+                    if ch == b"[":
+                        depth += 1
+                    elif ch == b"]":
+                        depth -= 1
+                    elif depth == 0 and ch in b" ()\r\n":
+                        break
+                    j += 1
+                yield seg[i:j]
+                i = j
+
+
+def _parse(tokens):
+    stack = [[]]
+    for tok in tokens:
+        if tok == b"(" and not isinstance(tok, _Literal):
+            stack.append([])
+        elif tok == b")" and not isinstance(tok, _Literal):
+            if len(stack) > 1:
+                done = stack.pop()
+                stack[-1].append(done)
+        elif not isinstance(tok, _Literal) and tok.upper() == b"NIL":
+            stack[-1].append(None)
+        else:
+            stack[-1].append(tok)
+    return stack[0]
+
+
+def parse_fetch_response(data):
+    """Parse imaplib FETCH output into one dict per message.
+
+    Keys are upper-cased item names (``UID``, ``BODYSTRUCTURE``,
+    ``BODY[...]``); values are bytes, ints or nested lists.
+    """
+    messages = []
+    flat = _parse(_tokenize(data))
+    for i in range(len(flat) - 1):
+        if not isinstance(flat[i], list) and isinstance(flat[i + 1], list) and flat[i].isdigit():
+            items = flat[i + 1]
+            msg = {}
+            for j in range(0, len(items) - 1, 2):
+                name = items[j].decode(errors="replace").upper()
+                # Servers echo BODY.PEEK[...] back as BODY[...]
+                name = name.replace("BODY.PEEK[", "BODY[")
+                msg[name] = items[j + 1]
+            if "UID" in msg:
+                msg["UID"] = int(msg["UID"])
+            messages.append(msg)
+    return messages
+
+
+def _text(value):
+    if value is None:
+        return ""
+    return value.decode(errors="replace")
+
+
+def _params(value):
+    if not isinstance(value, list):
+        return {}
+    return {_text(value[k]).lower(): _text(value[k + 1]) for k in range(0, len(value) - 1, 2)}
+
+
+def find_text_part(structure, prefix=""):
+    """Locate the first inline text/plain leaf in a BODYSTRUCTURE.
+
+    Returns ``(section, encoding, charset, size)`` or ``None``.
+    """
+    if not isinstance(structure, list) or not structure:
+        return None
+    if isinstance(structure[0], list):
+        index = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            index += 1
+            found = find_text_part(child, f"{prefix}{index}.")
+            if found:
+                return found
+        return None
+
+    ctype = _text(structure[0]).lower()
+    subtype = _text(structure[1]).lower() if len(structure) > 1 else ""
+    if ctype != "text" or subtype != "plain":
+        return None
+    disposition = structure[9] if len(structure) > 9 else None
+    if isinstance(disposition, list) and disposition and _text(disposition[0]).lower() == "attachment":
+        return None
+    charset = _params(structure[2]).get("charset", "utf-8")
+    encoding = _text(structure[5]).lower() if len(structure) > 5 else "7bit"
+    try:
+        size = int(structure[6])
+    except (IndexError, TypeError, ValueError):
+        size = 0
+    section = prefix.rstrip(".") or "1"
+    return section, encoding, charset, size
+
+
+def compress_uid_set(uids):
+    """Render UIDs as a compact IMAP sequence set, e.g. ``1,5,9:12``."""
+    nums = sorted({int(u) for u in uids})
+    if not nums:
+        return ""
+    ranges = []
+    start = prev = nums[0]
+    for n in nums[1:]:
+        if n == prev + 1:
+            prev = n
+            continue
+        ranges.append(f"{start}:{prev}" if start != prev else str(start))
+        start = prev = n
+    ranges.append(f"{start}:{prev}" if start != prev else str(start))
+    return ",".join(ranges)
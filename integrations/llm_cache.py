@@ -0,0 +1,147 @@
+"""Content-addressed LLM response cache: in-memory LRU in front of a SQLite TTL tier"""
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from pydantic_settings import BaseSettings
+from monitoring.metrics import metrics
+
+
+class LLMCacheConfig(BaseSettings):
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_SIZE: int = 512  # entries kept in memory
+    LLM_CACHE_PATH: str = "llm_cache.db"  # "" disables the persistent tier
+    LLM_CACHE_TTL: int = 7 * 24 * 3600  # seconds
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = LLMCacheConfig()
+
+
+class FallbackResponse(str):
+    """Canned text returned when a provider failed; never cached"""
+
+
+def cache_key(provider, model, params, prompt):
+    payload = json.dumps(
+        {"provider": provider, "model": model, "params": params or {}, "prompt": prompt},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Thread-safe two-tier cache keyed by ``cache_key``.
+
+    Memory hits are promoted to most-recently-used; disk hits are copied into
+    memory. Expired rows are purged on open and every ``purge_every`` writes.
+    """
+
+    def __init__(self, path=None, max_entries=None, ttl=None, purge_every=500):
+        self.path = config.LLM_CACHE_PATH if path is None else path
+        self.max_entries = max_entries or config.LLM_CACHE_SIZE
+        self.ttl = ttl or config.LLM_CACHE_TTL
+        self.purge_every = purge_every
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = None
+        if self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+            self.purge_expired()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    metrics.incr("llm_cache.hits")
+                    metrics.incr("llm_cache.memory_hits")
+                    return response
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row:
+                    self._remember(key, row[0], row[1])
+                    metrics.incr("llm_cache.hits")
+                    metrics.incr("llm_cache.disk_hits")
+                    return row[0]
+
+        metrics.incr("llm_cache.misses")
+        return None
+
+    def put(self, key, response):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, response, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, response, expires_at) VALUES (?, ?, ?)",
+                    (key, response, expires_at)
+                )
+                self._db.commit()
+                self._writes += 1
+                if self._writes % self.purge_every == 0:
+                    self._purge_locked()
+        metrics.gauge("llm_cache.memory_entries", len(self._memory))
+
+    def delete(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._db.commit()
+
+    def _remember(self, key, response, expires_at):
+        self._memory[key] = (response, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            metrics.incr("llm_cache.evictions")
+
+    def purge_expired(self):
+        with self._lock:
+            self._purge_locked()
+
+    def _purge_locked(self):
+        if self._db is None:
+            return
+        deleted = self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        self._db.commit()
+        if deleted:
+            print(f"[DEBUG] LLM cache purged {deleted} expired entries")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Process-wide cache, so every UnifiedLLM instance shares the same tiers"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
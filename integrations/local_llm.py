@@ -2,6 +2,7 @@
 import os
 import sys
 from pydantic_settings import BaseSettings
+from integrations.llm_cache import FallbackResponse
 
 try:
     from gpt4all import GPT4All
@@ -22,6 +23,8 @@ config = LLMConfig()
 
 class LocalLLMService:
     _model_instance = None
+    model_name = config.LLM_MODEL_PATH
+    sampling = {"max_tokens": 1000, "temp": 0.7}
 
     def __init__(self):
         if not GPT4ALL_AVAILABLE:
@@ -61,11 +64,65 @@ class LocalLLMService:
             return self._mock_fallback(prompt)
             
         import asyncio
-        return await asyncio.to_thread(self._generate, prompt)
+        import time
+        from monitoring.usage import record
+        submitted = time.perf_counter()
+
+        def generate():
+            # Time spent waiting for a free executor thread
+            record(queue_wait=time.perf_counter() - submitted)
+            return self._generate(prompt)
+
+        return await asyncio.to_thread(generate)
+
+    async def astream(self, prompt: str):
+        """Yield tokens from GPT4All's generate callback as they are produced"""
+        if not LocalLLMService._model_instance:
+            yield self._mock_fallback(prompt)
+            return
+
+        import asyncio
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+        stopped = False
+
+        def on_token(token_id, text):
+            loop.call_soon_threadsafe(queue.put_nowait, text)
+            return not stopped  # False ends generation once the consumer has gone
+
+        async def generate():
+            try:
+                await asyncio.to_thread(
+                    LocalLLMService._model_instance.generate, prompt, callback=on_token, **self.sampling
+                )
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        task = asyncio.create_task(generate())
+        try:
+            while True:
+                token = await queue.get()
+                if token is done:
+                    break
+                yield token
+        finally:
+            stopped = True
+        await task  # surfaces generation errors
+
+    async def warm_up(self):
+        """Generate one token so weights are paged in and GPU kernels compiled"""
+        if not LocalLLMService._model_instance:
+            raise RuntimeError(f"Local model {config.LLM_MODEL_PATH} is not loaded")
+        import asyncio
+        await asyncio.to_thread(LocalLLMService._model_instance.generate, "OK", max_tokens=1)
 
     def _mock_fallback(self, prompt: str) -> str:
         """Return mock responses when LLM is not ready"""
         print(f"Processing with Mock LLM (Model not loaded): {prompt[:50]}...")
+        return FallbackResponse(self._mock_response(prompt))
+
+    def _mock_response(self, prompt: str) -> str:
         
         # Simple rule-based mock for our specific prompts
         if "Analyze this email" in prompt:
@@ -80,9 +137,5 @@ class LocalLLMService:
         return "Mock response"
 
     def _generate(self, prompt: str) -> str:
-        output = LocalLLMService._model_instance.generate(
-            prompt,
-            max_tokens=1000,
-            temp=0.7
-        )
+        output = LocalLLMService._model_instance.generate(prompt, **self.sampling)
         return output
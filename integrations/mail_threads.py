@@ -0,0 +1,117 @@
+"""Conversation threads from Message-ID / In-Reply-To / References, and per-poll coalescing.
+
+Parsers add ``thread_fields`` to every fetched email: the Message-IDs it
+refers to and a provisional ``thread_id``, the conversation root named in its
+headers (Gmail overrides it with the native ``threadId``). ``resolve_threads``
+then joins emails that refer to each other or to a stored message, and
+``coalesce`` folds each thread of a poll into a single email for the agent.
+"""
+import re
+from pydantic_settings import BaseSettings
+
+
+class ThreadConfig(BaseSettings):
+    # One agent run per conversation per poll instead of one per message
+    THREAD_COALESCE: bool = True
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = ThreadConfig()
+
+_MSG_ID = re.compile(r"<([^<>\s]+)>")
+
+
+def message_ids(value):
+    """Message-IDs in a header value, in order, as ``<id>``"""
+    return [f"<{m}>" for m in _MSG_ID.findall(str(value or ""))]
+
+
+def get_header(headers, name):
+    """Header value from a Message or a dict, matching the name case-insensitively"""
+    if isinstance(headers, dict):
+        # Gmail hands headers over as a dict in whatever case the sender used
+        return next((v for k, v in headers.items() if k.lower() == name.lower()), None)
+    return headers.get(name)
+
+
+def thread_fields(headers, default=None):
+    """``references`` and provisional ``thread_id`` from a Message or a header dict"""
+    references = message_ids(get_header(headers, "References"))
+    in_reply_to = [i for i in message_ids(get_header(headers, "In-Reply-To")) if i not in references]
+    own = message_ids(get_header(headers, "Message-ID"))
+    # References lists the conversation root first; a bare In-Reply-To is the next best thing
+    root = (references or in_reply_to or own or [default])[0]
+    return {"references": references + in_reply_to, "thread_id": root}
+
+
+def resolve_threads(emails, known=None):
+    """Give every email of one conversation the same ``thread_id``, in place.
+
+    ``known`` maps Message-IDs of already stored messages to their thread, so
+    a reply whose References chain was truncated still finds its conversation.
+    """
+    known = dict(known or {})
+    # Twice, so a reply fetched before its parent (Gmail lists newest first) still joins it
+    for _ in range(2):
+        for email in emails:
+            parent = next((ref for ref in email.get("references") or () if ref in known), None)
+            if parent:
+                email["thread_id"] = known[parent]
+            for mid in message_ids(email.get("message_id")):
+                known.setdefault(mid, email["thread_id"])
+    return emails
+
+
+def coalesce(emails):
+    """One email per thread, in fetch order; single-message threads pass through untouched"""
+    threads = {}
+    for email in emails:
+        threads.setdefault(email["thread_id"], []).append(email)
+    return [group[0] if len(group) == 1 else _merge(group) for group in threads.values()]
+
+
+def _merge(group):
+    """Earlier messages oldest first, then the latest, minus what they repeat.
+
+    The result keeps the latest message's id, sender and subject; its
+    ``coalesced`` list holds the ``{"id", "message_id"}`` of the messages
+    folded into it, which are stored and flagged along with it.
+    """
+    from agent.normalize import normalize_body, drop_sign_off
+    referenced = {ref for email in group for ref in email.get("references") or ()}
+    leaves = [i for i, email in enumerate(group)
+              if not set(message_ids(email.get("message_id"))) & referenced]
+    # No other message replies to the latest one; the deepest such leaf wins
+    latest = group[max(leaves or range(len(group)),
+                       key=lambda i: (len(group[i].get("references") or ()), i))]
+    earlier = sorted((e for e in group if e is not latest), key=lambda e: len(e.get("references") or ()))
+
+    seen = set()
+
+    def fresh(text):
+        """Paragraphs not already included (quoted text and greetings repeat across replies)"""
+        kept = []
+        for paragraph in re.split(r"\n\s*\n", text):
+            key = " ".join(paragraph.lower().split())
+            if key and key not in seen:
+                seen.add(key)
+                kept.append(paragraph)
+        return "\n\n".join(kept)
+
+    # The latest message claims its paragraphs first and keeps its sign-off, so the
+    # body still ends like one email when the agent normalizes it again
+    last = fresh(normalize_body(latest["body"]))
+    parts = []
+    for email in earlier:
+        text = fresh(drop_sign_off(normalize_body(email["body"])))
+        if text:
+            parts.append(f"[Earlier in this thread, from {email['from']}]\n{text}")
+    parts.append(f"[Latest message]\n{last}" if parts else last)
+    print(f"[DEBUG] Coalesced {len(group)} messages of thread {latest['thread_id']} into {latest['id']}")
+    return {
+        **latest,
+        "body": "\n\n".join(parts),
+        "coalesced": [{"id": e["id"], "message_id": e.get("message_id")} for e in earlier]
+    }
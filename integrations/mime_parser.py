@@ -0,0 +1,216 @@
+"""Streaming extraction of the first text/plain part from raw MIME"""
+import base64
+import binascii
+import quopri
+from email.header import decode_header, make_header
+from email.message import Message
+from email.parser import BytesFeedParser
+from pydantic_settings import BaseSettings
+
+
+class MimeConfig(BaseSettings):
+    MAIL_BODY_MAX_BYTES: int = 64 * 1024
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = MimeConfig()
+
+
+def decode_text(payload, encoding, charset):
+    """Decode a (possibly truncated) transfer-encoded text payload"""
+    encoding = (encoding or "7bit").lower()
+    try:
+        if encoding == "base64":
+            compact = b"".join(payload.split())
+            payload = base64.b64decode(compact[:len(compact) - len(compact) % 4])
+        elif encoding == "quoted-printable":
+            payload = quopri.decodestring(payload)
+    except (binascii.Error, ValueError):
+        pass
+    try:
+        return payload.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        return payload.decode("latin-1", errors="replace")
+
+
+def decode_subject(raw):
+    """Decode an RFC 2047 header value, leaving it as-is when malformed"""
+    if not raw:
+        return ""
+    try:
+        return str(make_header(decode_header(raw)))
+    except (UnicodeDecodeError, LookupError):
+        return raw
+
+
+# Headers that mark bulk/automated mail; the agent prefilter reads them from email["headers"]
+BULK_HEADERS = ("list-unsubscribe", "list-id", "precedence", "auto-submitted")
+
+
+def bulk_headers(msg):
+    """Lower-cased BULK_HEADERS present on a parsed message"""
+    return {name: str(msg[name]) for name in BULK_HEADERS if msg is not None and msg[name]}
+
+
+def _parse_headers(raw):
+    parser = BytesFeedParser()
+    parser.feed(raw + b"\r\n")
+    return parser.close()
+
+
+class TextPartExtractor:
+    """Line-oriented MIME scanner that keeps only the first inline text/plain part.
+
+    Feed raw message bytes in chunks; everything outside that part (other
+    alternatives, attachments) is skipped line by line without ever being
+    decoded or held in memory. ``done`` turns True as soon as the part is
+    complete or ``max_bytes`` of it have been collected, so callers can stop
+    reading early.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or config.MAIL_BODY_MAX_BYTES
+        self.headers = None  # top-level headers, as an email.message.Message
+        self.done = False
+        self._partial = b""
+        self._boundaries = []
+        self._state = "headers"
+        self._header_lines = []
+        self._text = bytearray()
+        self._encoding = None
+        self._charset = None
+        self._body = None
+
+    def feed(self, chunk):
+        if self.done:
+            return
+        data = self._partial + chunk
+        lines = data.split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line + b"\n")
+            if self.done:
+                return
+
+    def close(self):
+        if self._partial and not self.done:
+            self._line(self._partial)
+        self._partial = b""
+        if self._state == "headers" and not self.done:
+            # The stream ended inside a header block: headers with no body is valid RFC 5322
+            self._start_entity(_parse_headers(b"".join(self._header_lines)))
+            self._header_lines = []
+        if self.headers is None:
+            self.headers = _parse_headers(b"")  # empty input; callers always get a Message
+        self._finish()
+        return self.body
+
+    @property
+    def body(self):
+        return self._body if self._body is not None else ""
+
+    def _line(self, line):
+        if self._state == "headers":
+            if line.strip(b"\r\n"):
+                self._header_lines.append(line)
+                return
+            self._start_entity(_parse_headers(b"".join(self._header_lines)))
+            self._header_lines = []
+            return
+
+        stripped = line.rstrip(b"\r\n")
+        if self._boundaries and stripped.startswith(b"--"):
+            for depth in range(len(self._boundaries) - 1, -1, -1):
+                marker = b"--" + self._boundaries[depth]
+                if stripped == marker or stripped == marker + b"--":
+                    if self._state == "text":
+                        self._finish()
+                        return
+                    del self._boundaries[depth + 1:]
+                    if stripped == marker:
+                        self._state = "headers"
+                    else:
+                        self._boundaries.pop()
+                        self._state = "skip"
+                    return
+
+        if self._state == "text":
+            self._text += line
+            if len(self._text) >= self.max_bytes:
+                del self._text[self.max_bytes:]
+                self._finish()
+
+    def _start_entity(self, headers):
+        if self.headers is None:
+            self.headers = headers
+        if headers.get_content_maintype() == "multipart":
+            boundary = headers.get_boundary()
+            if boundary:
+                self._boundaries.append(boundary.encode("latin-1", errors="replace"))
+            self._state = "skip"  # preamble
+        elif headers.get_content_type() == "text/plain" and headers.get_content_disposition() != "attachment":
+            self._state = "text"
+            self._encoding = headers.get("Content-Transfer-Encoding", "7bit").strip()
+            self._charset = headers.get_content_charset() or "utf-8"
+        else:
+            self._state = "skip"
+
+    def _finish(self):
+        if self.done:
+            return
+        self.done = True
+        if self._state == "text" or self._text:
+            raw = bytes(self._text)
+            # The CRLF before a boundary belongs to the delimiter, not the body
+            if raw.endswith(b"\r\n"):
+                raw = raw[:-2]
+            elif raw.endswith(b"\n"):
+                raw = raw[:-1]
+            self._body = decode_text(raw, self._encoding, self._charset)
+
+
+def extract_text_body(source, max_bytes=None, chunk_size=64 * 1024):
+    """Return ``(headers, body)`` for raw message bytes or an iterable of chunks"""
+    extractor = TextPartExtractor(max_bytes)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        chunks = (bytes(view[i:i + chunk_size]) for i in range(0, len(view), chunk_size))
+    else:
+        chunks = source
+    for chunk in chunks:
+        extractor.feed(chunk)
+        if extractor.done:
+            break
+    body = extractor.close()
+    return extractor.headers, body
+
+
+def extract_gmail_body(payload, max_bytes=None):
+    """Depth-first search of a Gmail ``payload.parts`` tree for inline text/plain"""
+    max_bytes = max_bytes or config.MAIL_BODY_MAX_BYTES
+    stack = [payload]
+    while stack:
+        part = stack.pop(0)
+        if part.get('parts'):
+            stack[0:0] = part['parts']
+            continue
+        body = part.get('body', {})
+        if part.get('mimeType', 'text/plain') != 'text/plain' or part.get('filename') or 'attachmentId' in body:
+            continue
+        data = body.get('data')
+        if not data:
+            continue
+        # base64url: 4 chars per 3 bytes, so this slice covers max_bytes of text
+        limit = (max_bytes + 2) // 3 * 4
+        raw = base64.urlsafe_b64decode(data[:limit] + "=" * (-len(data[:limit]) % 4))
+        # Gmail has already undone the transfer encoding, but not the charset
+        content_type = next((h['value'] for h in part.get('headers', []) if h['name'].lower() == 'content-type'), None)
+        charset = None
+        if content_type:
+            headers = Message()
+            headers['Content-Type'] = content_type
+            charset = headers.get_content_charset()
+        return decode_text(raw[:max_bytes], "8bit", charset)
+    return ""
@@ -0,0 +1,116 @@
+"""Process-wide LLM providers: built once, warmed up at startup, shared by every request"""
+import asyncio
+import time
+from datetime import datetime
+from pydantic_settings import BaseSettings
+from integrations.llm_wrapper import UnifiedLLM, config as llm_config
+from monitoring.metrics import metrics
+
+
+class ProviderRegistryConfig(BaseSettings):
+    LLM_WARMUP: bool = True  # prime the provider at startup; /health/ready waits for it
+    LLM_WARMUP_TIMEOUT: float = 120.0  # seconds; loading a local model can take a while
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = ProviderRegistryConfig()
+
+
+class ProviderRegistry:
+    """One ``UnifiedLLM`` per provider for the application's lifetime.
+
+    ``status`` per provider is "cold" (not built yet), "warming", "ready",
+    "degraded" (built, but a warm-up failed or a fallback stands in for the
+    real provider) or "failed" (could not be built at all).
+    """
+
+    def __init__(self):
+        self._llms = {}
+        self._state = {}
+        self._building = {}  # provider -> task constructing its UnifiedLLM
+        self._lock = asyncio.Lock()
+
+    async def get(self, provider=None):
+        """The shared instance, built on first use when startup did not warm it.
+
+        A build already in flight (startup warm-up) is awaited, not repeated.
+        """
+        provider = provider or llm_config.LLM_PROVIDER
+        if provider not in self._llms:
+            llm = await self._build(provider)
+            if provider not in self._state:
+                self._set(provider, "degraded" if llm.degraded else "cold")
+        return self._llms[provider]
+
+    async def _build(self, provider):
+        """Construct the provider once, off the event loop; concurrent callers share the task"""
+        task = self._building.get(provider)
+        if task is None:
+            # Constructing a local provider loads the model weights; keep the loop free
+            task = asyncio.ensure_future(asyncio.to_thread(UnifiedLLM, provider))
+            self._building[provider] = task
+            task.add_done_callback(lambda _: self._building.pop(provider, None))
+        # Shielded: a cancelled request must not abort the build others are waiting on
+        llm = await asyncio.shield(task)
+        return self._llms.setdefault(provider, llm)
+
+    async def warm_up(self, provider=None):
+        """Build the provider off the event loop and send it a priming request"""
+        provider = provider or llm_config.LLM_PROVIDER
+        async with self._lock:
+            if self._state.get(provider, {}).get("status") == "ready":
+                return self._llms[provider]
+            self._set(provider, "warming")
+            started = time.perf_counter()
+            try:
+                llm = await self._build(provider)
+                if config.LLM_WARMUP:
+                    await asyncio.wait_for(llm.warm_up(), config.LLM_WARMUP_TIMEOUT)
+                status, error = ("degraded", "serving mock responses") if llm.degraded else ("ready", None)
+            except Exception as e:
+                status = "degraded" if provider in self._llms else "failed"
+                error = str(e) or type(e).__name__
+                print(f"[ERROR] Warm-up of LLM provider {provider} failed: {error}")
+            seconds = time.perf_counter() - started
+            metrics.observe("llm.warmup_seconds", seconds)
+            self._set(provider, status, error=error, warmup_seconds=round(seconds, 3))
+            print(f"[DEBUG] LLM provider {provider}: {status} after {seconds:.2f}s")
+            return self._llms.get(provider)
+
+    def status(self):
+        provider = llm_config.LLM_PROVIDER
+        providers = {p: dict(s) for p, s in self._state.items()}
+        providers.setdefault(provider, {"status": "cold"})
+        return {
+            "ready": providers[provider]["status"] == "ready",
+            "provider": provider,
+            "providers": providers
+        }
+
+    def close(self):
+        self._llms.clear()
+        self._state.clear()
+
+    def _set(self, provider, status, **details):
+        llm = self._llms.get(provider)
+        service = llm.service if llm else None
+        self._state[provider] = {
+            "status": status,
+            "service": type(service).__name__ if service else None,
+            "model": getattr(service, "model_name", None),
+            "since": datetime.utcnow().isoformat(),
+            "error": None,
+            **{k: v for k, v in self._state.get(provider, {}).items() if k == "warmup_seconds"},
+            **details
+        }
+        metrics.gauge(f"llm.{provider}.ready", int(status == "ready"))
+
+
+registry = ProviderRegistry()
+
+
+async def get_llm(provider=None):
+    """Shared ``UnifiedLLM`` for ``provider`` (default: LLM_PROVIDER)"""
+    return await registry.get(provider)
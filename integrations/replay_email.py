@@ -0,0 +1,226 @@
+"""Offline email source that replays an mbox, Maildir or directory of .eml files"""
+import os
+import glob
+import time
+import mailbox
+import threading
+from email.mime.text import MIMEText
+from email.utils import make_msgid
+from typing import Literal
+from pydantic_settings import BaseSettings
+from integrations.mime_parser import extract_text_body, decode_subject, bulk_headers
+from integrations.mail_threads import thread_fields
+
+
+class ReplayConfig(BaseSettings):
+    REPLAY_SOURCE: str = "replay/inbox"
+    # "auto" picks maildir for a dir with cur/new, eml for other dirs, mbox for files
+    REPLAY_FORMAT: Literal["auto", "mbox", "maildir", "eml"] = "auto"
+    REPLAY_RATE: float = 0.0  # messages per second; 0 delivers everything at once
+    REPLAY_BURST: int = 1  # messages that arrive together; bursts keep the average at REPLAY_RATE
+    REPLAY_LOOP: bool = False  # start over (with fresh IDs) once the source is exhausted
+    REPLAY_OUTBOX: str = "replay/outbox"
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+config = ReplayConfig()
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _detect_format(path):
+    if os.path.isfile(path):
+        return "mbox"
+    if os.path.isdir(os.path.join(path, "cur")) or os.path.isdir(os.path.join(path, "new")):
+        return "maildir"
+    return "eml"
+
+
+class _ReplaySource:
+    """Ordered list of ``(key, loader)`` pairs; messages are read only when fetched"""
+
+    def __init__(self, path, fmt):
+        self.path = path
+        self.format = _detect_format(path) if fmt == "auto" else fmt
+        self.entries = []
+        self._lock = threading.Lock()
+        if self.format == "mbox":
+            box = mailbox.mbox(path, create=False)
+            self.entries = [(str(k), lambda k=k: box.get_bytes(k)) for k in box.keys()]
+        elif self.format == "maildir":
+            box = mailbox.Maildir(path, factory=None, create=False)
+            self.entries = [(k, lambda k=k: box.get_bytes(k)) for k in sorted(box.keys())]
+        else:
+            for file_path in sorted(glob.glob(os.path.join(path, "*.eml"))):
+                self.entries.append((os.path.basename(file_path), lambda p=file_path: _read_file(p)))
+
+    def read(self, index):
+        with self._lock:  # mailbox objects share one file handle
+            return self.entries[index][1]()
+
+
+class _ReplayState:
+    """Replay clock and cursor, shared by every service instance in the process"""
+
+    def __init__(self, source):
+        self.source = source
+        self.started = time.monotonic()
+        self.position = 0  # messages already handed out (across loops)
+        self.read = set()
+
+    def arrived(self):
+        """Number of messages delivered so far by the rate/burst schedule"""
+        total = len(self.source.entries)
+        limit = None if config.REPLAY_LOOP else total
+        if config.REPLAY_RATE <= 0:
+            return limit if limit is not None else self.position + total
+        burst = max(config.REPLAY_BURST, 1)
+        elapsed = time.monotonic() - self.started
+        count = (int(elapsed * config.REPLAY_RATE / burst) + 1) * burst
+        return count if limit is None else min(count, limit)
+
+
+_states = {}
+_states_lock = threading.Lock()
+
+
+def _get_state(path, fmt):
+    key = (os.path.abspath(path), fmt)
+    with _states_lock:
+        state = _states.get(key)
+        if state is None:
+            state = _ReplayState(_ReplaySource(path, fmt))
+            _states[key] = state
+        return state
+
+
+def reset_replay():
+    """Forget replay progress so the next service starts from the first message"""
+    with _states_lock:
+        _states.clear()
+
+
+class ReplayEmailService:
+    """Drop-in for StandardEmailService/GmailMCP that needs no mail server.
+
+    Messages "arrive" on a schedule set by REPLAY_RATE and REPLAY_BURST.
+    Each poll returns the ones that arrived since the last committed cursor.
+    Drafts and sent mail are written as .eml files under REPLAY_OUTBOX.
+    """
+
+    def __init__(self, source=None, fmt=None, outbox=None):
+        self.source_path = source or config.REPLAY_SOURCE
+        self.state = _get_state(self.source_path, fmt or config.REPLAY_FORMAT)
+        self.outbox = outbox or config.REPLAY_OUTBOX
+        self.user = "replay@localhost"
+        self._pending_cursor = None
+        self.more_pending = False  # the last get_unread_emails left mail for the next poll
+
+    @property
+    def sync_source(self):
+        return f"replay:{os.path.abspath(self.source_path)}"
+
+    def _email_id(self, position):
+        entries = self.state.source.entries
+        key = f"{os.path.basename(os.path.normpath(self.source_path))}/{entries[position % len(entries)][0]}"
+        loop = position // len(entries)
+        # Looping replays need fresh IDs or the dedup check would skip them all
+        return f"replay:{key}" if loop == 0 else f"replay:{loop}:{key}"
+
+    async def get_unread_emails(self, max_results=5, triage=None):
+        """Return up to ``max_results`` messages that arrived since the last commit"""
+        import asyncio
+        entries = self.state.source.entries
+        if not entries:
+            return []
+        start = self.state.position
+        end = min(self.state.arrived(), start + max_results)
+        self._pending_cursor = end
+        self.more_pending = end < self.state.arrived()
+        if end <= start:
+            return []
+
+        emails = []
+        for position in range(start, end):
+            e_id = self._email_id(position)
+            if e_id in self.state.read:
+                continue
+            raw = await asyncio.to_thread(self.state.source.read, position % len(entries))
+            email = self._parse(e_id, raw)
+            if triage is None or triage(email):
+                emails.append(email)
+        return emails
+
+    async def fetch_emails(self, email_ids):
+        """Read specific, already delivered messages again (runs that failed on an earlier poll)"""
+        import asyncio
+        wanted = set(email_ids)
+        entries = self.state.source.entries
+        emails = []
+        for position in range(self.state.position):
+            e_id = self._email_id(position)
+            if e_id in wanted:
+                raw = await asyncio.to_thread(self.state.source.read, position % len(entries))
+                emails.append(self._parse(e_id, raw))
+        return emails
+
+    async def commit_sync_cursor(self):
+        if self._pending_cursor is None:
+            return
+        self.state.position = max(self.state.position, self._pending_cursor)
+        self._pending_cursor = None
+
+    def _parse(self, e_id, raw):
+        msg, body = extract_text_body(raw)
+        return {
+            "id": e_id,
+            "from": msg.get("From", ""),
+            "subject": decode_subject(msg.get("Subject")),
+            "message_id": msg.get("Message-ID", ""),
+            "headers": bulk_headers(msg),
+            "body": body,
+            **thread_fields(msg, e_id)
+        }
+
+    async def create_draft(self, to, subject, body, thread_id=None):
+        """Write the draft to the outbox; its file name doubles as the draft ID"""
+        import asyncio
+        return await asyncio.to_thread(self._write, "drafts", to, subject, body)
+
+    async def send_email(self, to, subject, body):
+        import asyncio
+        await asyncio.to_thread(self._write, "sent", to, subject, body)
+
+    async def send_many(self, messages):
+        errors = []
+        for m in messages:
+            try:
+                await self.send_email(m["to"], m["subject"], m["body"])
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+        return errors
+
+    def _write(self, folder, to, subject, body):
+        msg = MIMEText(body)
+        msg["Subject"] = subject
+        msg["From"] = self.user
+        msg["To"] = to
+        msg["Message-ID"] = make_msgid(domain="replay.local")
+        directory = os.path.join(self.outbox, folder)
+        os.makedirs(directory, exist_ok=True)
+        name = f"{time.time_ns()}-{threading.get_ident()}.eml"
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(msg.as_bytes())
+        return name
+
+    async def mark_as_read(self, msg_id):
+        self.state.read.add(str(msg_id))
+
+    async def mark_many_as_read(self, msg_ids):
+        self.state.read.update(str(m) for m in msg_ids)
@@ -0,0 +1,152 @@
+"""Pooled, persistent SMTP sessions with concurrent batch sends"""
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _is_connection_error(exc):
+    """True when the session itself is gone, not when the message was rejected"""
+    if isinstance(exc, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return exc.smtp_code == 421  # "service not available, closing transmission channel"
+    if isinstance(exc, smtplib.SMTPException):
+        return False
+    return isinstance(exc, OSError)  # resets, timeouts
+
+
+class SMTPConnectionPool:
+    """Keeps authenticated SMTP sessions alive between sends.
+
+    Sessions idle longer than ``check_after`` are NOOP-checked before reuse;
+    a session whose last transaction failed is RSET before going back.
+    Dead sessions (421, disconnects, timeouts) are dropped and the send is
+    retried once on a fresh connection.
+    """
+
+    def __init__(self, host, port, user, password, size=3, check_after=30,
+                 connect=None, timeout=30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = size
+        self.check_after = check_after
+        self.timeout = timeout
+        # Factory is injectable so the pool can run against a local SMTP sink;
+        # it must return a session that is already logged in (if auth is needed)
+        self._connect_fn = connect or self._default_connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _default_connect(self):
+        server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        try:
+            server.login(self.user, self.password)
+        except BaseException:
+            server.close()
+            raise
+        return server
+
+    def _is_alive(self, server):
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _discard(self, server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    server, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect_fn()
+                if time.monotonic() - last_used < self.check_after or self._is_alive(server):
+                    return server
+                self._discard(server)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, server, broken=False, dirty=False):
+        try:
+            if not broken and dirty:
+                try:
+                    server.rset()
+                except (smtplib.SMTPException, OSError):
+                    broken = True
+            if broken:
+                self._discard(server)
+            else:
+                self._idle.put((server, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def send(self, msg, retries=1):
+        for attempt in range(retries + 1):
+            server = self.acquire()
+            try:
+                server.send_message(msg)
+            except Exception as e:
+                broken = _is_connection_error(e)
+                self.release(server, broken=broken, dirty=True)
+                if broken and attempt < retries:
+                    print(f"[DEBUG] SMTP session dropped ({e}), reconnecting...")
+                    continue
+                raise
+            self.release(server)
+            return
+
+    def send_many(self, messages):
+        """Send over up to ``size`` sessions at once; returns one error (or None) per message"""
+        def send_one(msg):
+            try:
+                self.send(msg)
+                return None
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=min(self.size, max(len(messages), 1))) as executor:
+            return list(executor.map(send_one, messages))
+
+    def close(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(server)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_smtp_pool(host, port, user, password, **kwargs):
+    """Return the process-wide pool for this account, creating it on first use."""
+    key = (host, port, user)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SMTPConnectionPool(host, port, user, password, **kwargs)
+            _pools[key] = pool
+        return pool
+
+
+def close_all_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
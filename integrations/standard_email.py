@@ -1,10 +1,18 @@
 """Standard IMAP/SMTP Email Service"""
-import imaplib
-import smtplib
 import email
 from email.mime.text import MIMEText
-from email.header import decode_header
+from typing import Literal
 from pydantic_settings import BaseSettings
+from integrations.imap_pool import get_imap_pool
+from integrations.smtp_pool import get_smtp_pool
+from integrations.imap_protocol import (
+    parse_fetch_response, find_text_part, compress_uid_set
+)
+from integrations.mime_parser import (
+    extract_text_body, decode_text, decode_subject as _decode_subject, bulk_headers,
+    config as mime_config
+)
+from integrations.mail_threads import thread_fields
 
 class EmailConfig(BaseSettings):
     EMAIL_USER: str
@@ -12,6 +20,16 @@ class EmailConfig(BaseSettings):
     IMAP_SERVER: str = "imap.gmail.com"
     SMTP_SERVER: str = "smtp.gmail.com"
     SMTP_PORT: int = 465
+    IMAP_POOL_SIZE: int = 2
+    IMAP_NOOP_AFTER: int = 30  # seconds idle before a pooled session is NOOP-checked
+    # "pipelined": headers first, then text/plain only; "rfc822": full source per message
+    IMAP_FETCH_MODE: Literal["pipelined", "rfc822"] = "pipelined"
+    # Push-driven ingestion: hold an IDLE session and run the pipeline on new mail
+    IMAP_IDLE_ENABLED: bool = False
+    IMAP_IDLE_RENEW: int = 25 * 60  # re-issue IDLE before the server's 29-minute cutoff
+    IMAP_POLL_INTERVAL: int = 60  # used when the server has no IDLE capability
+    SMTP_POOL_SIZE: int = 3
+    SMTP_NOOP_AFTER: int = 30
 
     class Config:
         env_file = ".env"
@@ -19,77 +37,209 @@ class EmailConfig(BaseSettings):
 
 config = EmailConfig()
 
+HEADER_FIELDS = "FROM SUBJECT MESSAGE-ID IN-REPLY-TO REFERENCES LIST-UNSUBSCRIBE LIST-ID PRECEDENCE AUTO-SUBMITTED"
+
+def _email_id(validity, uid):
+    # UIDs are only unique within one UIDVALIDITY epoch, so both go into the ID
+    return f"{validity}:{uid}"
+
+def _parse_email_id(e_id):
+    """Split an email ID into (uidvalidity, uid); bare UIDs give (None, uid)"""
+    if ":" in str(e_id):
+        validity, uid = str(e_id).split(":", 1)
+        return int(validity), int(uid)
+    return None, int(e_id)
+
 class StandardEmailService:
     def __init__(self):
         self.imap_server = config.IMAP_SERVER
         self.smtp_server = config.SMTP_SERVER
         self.user = config.EMAIL_USER
         self.password = config.EMAIL_PASSWORD
+        self.more_pending = False  # the last get_unread_emails left mail for the next poll
+        # Shared by fetch, flag and search paths so each call reuses a logged-in session
+        self.pool = get_imap_pool(
+            self.imap_server,
+            self.user,
+            self.password,
+            size=config.IMAP_POOL_SIZE,
+            check_after=config.IMAP_NOOP_AFTER
+        )
+        self.smtp_pool = get_smtp_pool(
+            self.smtp_server,
+            config.SMTP_PORT,
+            self.user,
+            self.password,
+            size=config.SMTP_POOL_SIZE,
+            check_after=config.SMTP_NOOP_AFTER
+        )
+
+    @property
+    def sync_source(self):
+        return f"imap:{self.user}@{self.imap_server}/INBOX"
+
+    async def get_unread_emails(self, max_results=5, triage=None):
+        """Fetch mail that arrived since the last committed sync cursor
 
-    def _connect_imap(self):
-        mail = imaplib.IMAP4_SSL(self.imap_server)
-        mail.login(self.user, self.password)
-        return mail
+        Only ``UID last+1:*`` is searched, oldest first, so a poll never
+        drops mail (anything past ``max_results`` is picked up next poll).
+        Call ``commit_sync_cursor()`` once the returned emails are handled.
 
-    async def get_unread_emails(self, max_results=5):
-        """Fetch unread emails from Inbox"""
-        # Note: In a real async app, this should run in a thread executor
-        # but for simplicity in MVP we'll run blocking or wrap in asyncio.to_thread
+        In pipelined mode only headers and BODYSTRUCTURE are downloaded first;
+        ``triage(email)`` sees the header-only dict and can return False to
+        skip the body download for that message (e.g. already processed).
+        """
         import asyncio
-        return await asyncio.to_thread(self._fetch_emails_blocking, max_results)
+        from integrations.storage import StorageService
+        storage = StorageService()
+        try:
+            cursor = storage.get_sync_cursor(self.sync_source)
+        finally:
+            storage.close()
+
+        validity, uids, high_water, self.more_pending = await asyncio.to_thread(
+            self._sync_uids_blocking, cursor, max_results
+        )
+        self._pending_cursor = (validity, high_water)
+        if not uids:
+            return []
+        print(f"[DEBUG] Fetching emails: {uids}")
+
+        if config.IMAP_FETCH_MODE == "rfc822":
+            emails = await asyncio.to_thread(self._fetch_rfc822_blocking, validity, uids)
+            return [e for e in emails if triage is None or triage(e)]
+
+        candidates = await asyncio.to_thread(self._fetch_headers_blocking, validity, uids)
+        wanted = [(e, part) for e, part in candidates if triage is None or triage(e)]
+        if not wanted:
+            return []
+        return await asyncio.to_thread(self._fetch_bodies_blocking, wanted)
 
-    def _fetch_emails_blocking(self, max_results):
-        mail = self._connect_imap()
+    async def fetch_emails(self, email_ids):
+        """Download specific messages again (runs that failed on an earlier poll)"""
+        import asyncio
+        validity = await asyncio.to_thread(lambda: self.pool.run(self.pool.uidvalidity))
+        # UIDs from an older UIDVALIDITY epoch may now name different messages
+        uids = [uid for v, uid in map(_parse_email_id, email_ids) if v == validity]
+        if not uids:
+            return []
+        return await asyncio.to_thread(self._fetch_rfc822_blocking, validity, uids)
+
+    async def commit_sync_cursor(self):
+        """Persist the position reached by the last get_unread_emails call"""
+        pending = getattr(self, "_pending_cursor", None)
+        if not pending:
+            return
+        from integrations.storage import StorageService
+        storage = StorageService()
         try:
-            mail.select("inbox")
-            # Fetch ALL messages (to catch ones user might have opened)
-            # We rely on DB deduping to avoid re-processing
-            status, messages = mail.search(None, "ALL")
+            storage.save_sync_cursor(self.sync_source, *pending)
+        finally:
+            storage.close()
+        self._pending_cursor = None
+
+    def _sync_uids_blocking(self, cursor, max_results):
+        def sync(mail):
+            validity = self.pool.uidvalidity(mail)
+            if cursor and cursor[0] == str(validity):
+                last_uid = int(cursor[1])
+            else:
+                # First run or UIDVALIDITY changed: every stored UID is meaningless now.
+                # Re-baseline so we pick up the latest N messages, like a fresh install.
+                print(f"[DEBUG] Resyncing {self.sync_source} (UIDVALIDITY {validity})")
+                status, messages = mail.uid("SEARCH", None, "ALL")
+                all_uids = [int(u) for u in messages[0].split()] if status == "OK" else []
+                last_uid = all_uids[-max_results - 1] if len(all_uids) > max_results else 0
+
+            status, messages = mail.uid("SEARCH", None, f"UID {last_uid + 1}:*")
             if status != "OK":
-                return []
-            
-            email_ids = messages[0].split()
-            # Get latest 5 emails
-            email_ids = email_ids[-max_results:]
-            print(f"[DEBUG] Fetching emails: {email_ids}")
-            
+                return validity, [], last_uid, False
+            # "n:*" always matches the newest message even when its UID is < n
+            new_uids = sorted(u for u in (int(x) for x in messages[0].split()) if u > last_uid)
+            more = len(new_uids) > max_results
+            new_uids = new_uids[:max_results]
+            return validity, new_uids, (new_uids[-1] if new_uids else last_uid), more
+        return self.pool.run(sync)
+
+    def _fetch_headers_blocking(self, validity, uids):
+        """One UID FETCH for the whole set: triage headers + BODYSTRUCTURE only"""
+        items = f"(UID BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})] BODYSTRUCTURE)"
+        status, data = self.pool.run(lambda mail: mail.uid("FETCH", compress_uid_set(uids), items))
+        if status != "OK":
+            return []
+
+        results = []
+        for msg in parse_fetch_response(data):
+            header_key = next((k for k in msg if k.startswith("BODY[HEADER")), None)
+            headers = email.message_from_bytes(msg.get(header_key) or b"")
+            e_id = _email_id(validity, msg["UID"])
+            results.append(({
+                "id": e_id,
+                "from": headers.get("From", ""),
+                "subject": _decode_subject(headers.get("Subject")),
+                "message_id": headers.get("Message-ID", ""),
+                "headers": bulk_headers(headers),
+                "body": "",
+                # IMAP has no thread ID like Gmail's; the headers name the conversation root
+                **thread_fields(headers, e_id)
+            }, find_text_part(msg.get("BODYSTRUCTURE"))))
+        results.sort(key=lambda r: _parse_email_id(r[0]["id"])[1])
+        return results
+
+    def _fetch_bodies_blocking(self, wanted):
+        """Fetch only the text/plain section, one UID FETCH per distinct section path"""
+        by_section = {}
+        for e, part in wanted:
+            if part:
+                by_section.setdefault(part[0], []).append((e, part))
+
+        # Partial fetch: the server never sends more than the body cap
+        cap = mime_config.MAIL_BODY_MAX_BYTES
+
+        def fetch(mail):
+            for section, group in by_section.items():
+                uids = [_parse_email_id(e["id"])[1] for e, _ in group]
+                status, data = mail.uid("FETCH", compress_uid_set(uids), f"(UID BODY.PEEK[{section}]<0.{cap}>)")
+                if status != "OK":
+                    continue
+                bodies = {}
+                for m in parse_fetch_response(data):
+                    key = next((k for k in m if k.startswith(f"BODY[{section}]")), None)
+                    bodies[m["UID"]] = m.get(key) or b""
+                for e, (_, encoding, charset, _) in group:
+                    e["body"] = decode_text(bodies.get(_parse_email_id(e["id"])[1], b""), encoding, charset)
+
+        if by_section:
+            self.pool.run(fetch)
+        return [e for e, _ in wanted]
+
+    def _fetch_rfc822_blocking(self, validity, uids):
+        """Legacy mode: download the full source of every message, one by one"""
+        def fetch(mail):
             results = []
-            for e_id in email_ids:
-                print(f"[DEBUG] Fetching email ID: {e_id}")
-                _, msg_data = mail.fetch(e_id, "(RFC822)")
+            for uid in uids:
+                print(f"[DEBUG] Fetching email ID: {uid}")
+                _, msg_data = mail.uid("FETCH", str(uid), "(RFC822)")
                 for response_part in msg_data:
                     if isinstance(response_part, tuple):
-                        msg = email.message_from_bytes(response_part[1])
-                        subject, encoding = decode_header(msg["Subject"])[0]
-                        if isinstance(subject, bytes):
-                            subject = subject.decode(encoding if encoding else "utf-8")
-                        
-                        from_ = msg.get("From")
-                        body = ""
-                        if msg.is_multipart():
-                            for part in msg.walk():
-                                if part.get_content_type() == "text/plain":
-                                    try:
-                                        body = part.get_payload(decode=True).decode(errors='replace')
-                                    except:
-                                        body = part.get_payload(decode=True).decode('latin-1', errors='replace')
-                                    break
-                        else:
-                            try:
-                                body = msg.get_payload(decode=True).decode(errors='replace')
-                            except:
-                                body = msg.get_payload(decode=True).decode('latin-1', errors='replace')
-
-                        results.append({
-                            "id": e_id.decode(),
-                            "from": from_,
-                            "subject": subject,
-                            "body": body,
-                            "thread_id": e_id.decode() # IMAP doesn't have native thread_id same as Gmail API
-                        })
+                        results.append(self._parse_rfc822(_email_id(validity, uid), response_part[1]))
             return results
-        finally:
-            mail.logout()
+        return self.pool.run(fetch)
+
+    def _parse_rfc822(self, e_id, raw):
+        # Streams past attachments instead of building the full message tree
+        msg, body = extract_text_body(raw)
+        subject = _decode_subject(msg["Subject"])
+
+        return {
+            "id": e_id,
+            "from": msg.get("From"),
+            "subject": subject,
+            "message_id": msg.get("Message-ID", ""),
+            "headers": bulk_headers(msg),
+            "body": body,
+            **thread_fields(msg, e_id)
+        }
 
     async def create_draft(self, to, subject, body, thread_id=None):
         """Simulate draft creation by returning a placeholder ID."""
@@ -100,15 +250,24 @@ class StandardEmailService:
         import asyncio
         await asyncio.to_thread(self._send_email_blocking, to, subject, body)
 
-    def _send_email_blocking(self, to, subject, body):
+    async def send_many(self, messages):
+        """Send dicts of to/subject/body concurrently over pooled SMTP sessions.
+
+        Returns one entry per message: None on success, the exception otherwise.
+        """
+        import asyncio
+        built = [self._build_message(m["to"], m["subject"], m["body"]) for m in messages]
+        return await asyncio.to_thread(self.smtp_pool.send_many, built)
+
+    def _build_message(self, to, subject, body):
         msg = MIMEText(body)
         msg["Subject"] = subject
         msg["From"] = self.user
         msg["To"] = to
+        return msg
 
-        with smtplib.SMTP_SSL(self.smtp_server, config.SMTP_PORT) as server:
-            server.login(self.user, self.password)
-            server.send_message(msg)
+    def _send_email_blocking(self, to, subject, body):
+        self.smtp_pool.send(self._build_message(to, subject, body))
 
     async def mark_as_read(self, msg_id):
         """Mark email as seen"""
@@ -116,9 +275,31 @@ class StandardEmailService:
         await asyncio.to_thread(self._mark_read_blocking, msg_id)
 
     def _mark_read_blocking(self, msg_id):
-        mail = self._connect_imap()
-        try:
-            mail.select("inbox")
-            mail.store(msg_id, "+FLAGS", "\\Seen")
-        finally:
-            mail.logout()
+        validity, uid = _parse_email_id(msg_id)
+
+        def store(mail):
+            if validity is not None and validity != self.pool.uidvalidity(mail):
+                print(f"[DEBUG] Skipping flag for {msg_id}: UIDVALIDITY changed")
+                return
+            mail.uid("STORE", str(uid), "+FLAGS", "(\\Seen)")
+        self.pool.run(store)
+
+    async def mark_many_as_read(self, msg_ids):
+        """Mark a batch as seen with one UID STORE per UIDVALIDITY epoch"""
+        import asyncio
+        await asyncio.to_thread(self._mark_many_read_blocking, msg_ids)
+
+    def _mark_many_read_blocking(self, msg_ids):
+        by_validity = {}
+        for msg_id in msg_ids:
+            validity, uid = _parse_email_id(msg_id)
+            by_validity.setdefault(validity, []).append(uid)
+
+        def store(mail):
+            current = self.pool.uidvalidity(mail)
+            for validity, uids in by_validity.items():
+                if validity is not None and validity != current:
+                    print(f"[DEBUG] Dropping {len(uids)} flag(s) from UIDVALIDITY {validity}")
+                    continue
+                mail.uid("STORE", compress_uid_set(uids), "+FLAGS", "(\\Seen)")
+        self.pool.run(store)
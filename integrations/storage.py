@@ -2,7 +2,12 @@
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime
-from app.models import SessionLocal, Client, Proposal
+from sqlalchemy import or_
+from app.models import (
+    SessionLocal, Client, Proposal, SyncCursor, PendingFlag, ClassificationRecord, EmailFingerprint,
+    RunMetrics, ThreadMessage, FailedMessage, ProposalInquiry
+)
+from agent.fingerprint import bands, hamming, to_signed, to_unsigned, sender_address
 from app.schemas import EmailSchema, ProposalSchema
 import json
 
@@ -15,7 +20,21 @@ class StorageService:
         existing_client = self.db.query(Client).filter(Client.email_id == state.get('email_id')).first()
         if existing_client:
             return existing_client.id
-            
+
+        # A follow-up in a conversation that already has a client updates that client
+        existing_client = self.thread_client(state['thread_id'])
+        if existing_client:
+            self._update_client(existing_client, state)
+            return existing_client.id
+
+        # A new conversation from a known address is a new inquiry by the same client:
+        # clients.email is unique, so the row is reused and its details are replaced.
+        # Earlier proposals keep their own inquiry's details (proposal_inquiries).
+        existing_client = self.client_for_sender(state['email_from'])
+        if existing_client:
+            self._update_client(existing_client, state, follow_up=False)
+            return existing_client.id
+
         client = Client(
             name=state['client_name'],
             email=state['email_from'],
@@ -32,6 +51,55 @@ class StorageService:
         self.db.refresh(client)
         return client.id
     
+    def thread_client(self, thread_id):
+        """The client an earlier message of this conversation produced or updated, if any"""
+        row = self.db.query(ThreadMessage).filter(
+            ThreadMessage.thread_id == thread_id, ThreadMessage.client_id.isnot(None)
+        ).order_by(ThreadMessage.id.desc()).first()
+        if row:
+            return self.db.query(Client).filter(Client.id == row.client_id).first()
+        return self.db.query(Client).filter(Client.thread_id == thread_id).first()
+
+    def client_for_sender(self, sender):
+        """The client whose stored From header has the same address as ``sender``"""
+        address = sender_address(sender)
+        if not address:
+            return None
+        # clients.email holds the raw From header ("Name <addr>"); compare parsed addresses
+        candidates = self.db.query(Client).filter(Client.email.ilike(f"%{address}%")).all()
+        return next((c for c in candidates if sender_address(c.email) == address), None)
+
+    def _update_client(self, client, state, follow_up=True):
+        """Newer details win; a follow-up's requirements accumulate across the conversation"""
+        for field in ('company', 'project_type', 'timeline', 'budget'):
+            if state.get(field) or not follow_up:
+                setattr(client, field, state.get(field))
+        if state.get('client_name') and state['client_name'] != 'Unknown':
+            client.name = state['client_name']
+        requirements = json.loads(client.requirements or '[]') if follow_up else []
+        requirements += [r for r in state.get('requirements') or [] if r not in requirements]
+        client.requirements = json.dumps(requirements)
+        client.thread_id = state['thread_id']
+        client.status = 'updated' if follow_up else 'new'
+        self.db.commit()
+        kind = "follow-up" if follow_up else "new inquiry"
+        print(f"[DEBUG] Updated client {client.id} from {kind} {state['email_id']}")
+
+    def supersede_proposals(self, client_id, thread_id):
+        """Retire the pending proposals of this conversation; a follow-up gets a fresh one.
+
+        Proposals of the client's other conversations stay pending. A proposal
+        belongs to the thread of the message whose run produced it.
+        """
+        thread_emails = self.db.query(ThreadMessage.email_id).filter(ThreadMessage.thread_id == thread_id)
+        proposal_ids = self.db.query(RunMetrics.proposal_id).filter(
+            RunMetrics.email_id.in_(thread_emails), RunMetrics.proposal_id.isnot(None)
+        )
+        self.db.query(Proposal).filter(
+            Proposal.client_id == client_id, Proposal.status == 'pending', Proposal.id.in_(proposal_ids)
+        ).update({Proposal.status: 'superseded'}, synchronize_session=False)
+        self.db.commit()
+
     def create_proposal(self, client_id, state, draft_id):
         proposal = Proposal(
             client_id=client_id,
@@ -42,9 +110,38 @@ class StorageService:
             status='pending'
         )
         self.db.add(proposal)
+        self.db.flush()
+        self.db.add(ProposalInquiry(
+            proposal_id=proposal.id,
+            thread_id=state.get('thread_id'),
+            company=state.get('company'),
+            project_type=state.get('project_type'),
+            requirements=json.dumps(state.get('requirements') or []),
+            timeline=state.get('timeline'),
+            budget=state.get('budget')
+        ))
         self.db.commit()
         self.db.refresh(proposal)
         return proposal.id
+
+    def proposal_details(self, proposal, client=None):
+        """Project details of the inquiry a proposal answers.
+
+        The client row is shared by all of a sender's inquiries and holds the
+        latest one, so it is only the fallback (proposals stored before
+        proposal_inquiries existed).
+        """
+        inquiry = self.db.query(ProposalInquiry).filter(ProposalInquiry.proposal_id == proposal.id).first()
+        source = inquiry or client or self.get_client(proposal.client_id)
+        if source is None:
+            return {}
+        return {
+            'company': source.company,
+            'project_type': source.project_type,
+            'requirements': json.loads(source.requirements or '[]'),
+            'timeline': source.timeline,
+            'budget': source.budget
+        }
     
     def get_pending_proposals(self):
         proposals = self.db.query(Proposal).filter(Proposal.status == 'pending').all()
@@ -55,7 +152,7 @@ class StorageService:
                 'id': p.id,
                 'client_name': client.name,
                 'client_email': client.email,
-                'project_type': client.project_type,
+                'project_type': self.proposal_details(p, client).get('project_type'),
                 'proposal_text': p.proposal_text,
                 'cost_min': p.cost_min,
                 'cost_max': p.cost_max,
@@ -92,7 +189,192 @@ class StorageService:
     def is_email_processed(self, email_id):
         """Check if email has already been processed by looking up email_id in database"""
         existing = self.db.query(Client).filter(Client.email_id == email_id).first()
-        return existing is not None
+        if existing is not None:
+            return True
+        # Follow-ups and messages coalesced into another run have no client row of their own
+        return self.db.query(ThreadMessage).filter(ThreadMessage.email_id == email_id).first() is not None
+
+    def thread_ids_for(self, message_ids):
+        """``{message_id: thread_id}`` for the stored messages among ``message_ids``"""
+        if not message_ids:
+            return {}
+        rows = self.db.query(ThreadMessage).filter(ThreadMessage.message_id.in_(list(message_ids))).all()
+        return {row.message_id: row.thread_id for row in rows}
+
+    def record_thread_messages(self, thread_id, messages, client_id=None):
+        """Store ``{"id", "message_id"}`` dicts as members of ``thread_id``"""
+        from integrations.mail_threads import message_ids
+        for message in messages:
+            if self.db.query(ThreadMessage).filter(ThreadMessage.email_id == message["id"]).first():
+                continue
+            ids = message_ids(message.get("message_id"))
+            self.db.add(ThreadMessage(
+                email_id=message["id"],
+                message_id=ids[0] if ids else None,
+                thread_id=thread_id,
+                client_id=client_id
+            ))
+        self.db.commit()
     
+    def get_sync_cursor(self, source):
+        """Return (validity, position) for a mailbox, or None if never synced"""
+        cursor = self.db.query(SyncCursor).filter(SyncCursor.source == source).first()
+        if not cursor:
+            return None
+        return cursor.validity, cursor.position
+
+    def save_sync_cursor(self, source, validity, position):
+        cursor = self.db.query(SyncCursor).filter(SyncCursor.source == source).first()
+        if not cursor:
+            cursor = SyncCursor(source=source)
+            self.db.add(cursor)
+        cursor.validity = str(validity)
+        cursor.position = str(position)
+        self.db.commit()
+
+    def add_pending_flag(self, source, msg_id):
+        self.db.add(PendingFlag(source=source, msg_id=str(msg_id)))
+        self.db.commit()
+
+    def get_pending_flags(self, source):
+        rows = self.db.query(PendingFlag).filter(PendingFlag.source == source).order_by(PendingFlag.id).all()
+        return [r.msg_id for r in rows]
+
+    def clear_pending_flags(self, source, msg_ids):
+        self.db.query(PendingFlag).filter(
+            PendingFlag.source == source,
+            PendingFlag.msg_id.in_([str(m) for m in msg_ids])
+        ).delete(synchronize_session=False)
+        self.db.commit()
+
+    def get_failed_messages(self, source):
+        rows = self.db.query(FailedMessage).filter(FailedMessage.source == source).order_by(FailedMessage.id).all()
+        return [r.msg_id for r in rows]
+
+    def record_failed_message(self, source, msg_id, error, max_attempts):
+        """Count a failed run; returns False (and forgets the message) once attempts run out"""
+        row = self.db.query(FailedMessage).filter(
+            FailedMessage.source == source, FailedMessage.msg_id == str(msg_id)
+        ).first()
+        if not row:
+            row = FailedMessage(source=source, msg_id=str(msg_id), attempts=0)
+            self.db.add(row)
+        row.attempts += 1
+        row.error = str(error)[:2000]
+        keep = row.attempts < max_attempts
+        if not keep:
+            self.db.delete(row)
+        self.db.commit()
+        return keep
+
+    def add_failed_message(self, source, msg_id, error):
+        """Queue a message that could not even be fetched; costs no attempt"""
+        exists = self.db.query(FailedMessage).filter(
+            FailedMessage.source == source, FailedMessage.msg_id == str(msg_id)
+        ).first()
+        if not exists:
+            self.db.add(FailedMessage(source=source, msg_id=str(msg_id), attempts=0, error=str(error)))
+            self.db.commit()
+
+    def clear_failed_messages(self, source, msg_ids):
+        self.db.query(FailedMessage).filter(
+            FailedMessage.source == source,
+            FailedMessage.msg_id.in_([str(m) for m in msg_ids])
+        ).delete(synchronize_session=False)
+        self.db.commit()
+
+    def record_classification(self, state):
+        """Store how an email was classified; emails whose classification failed are skipped"""
+        if not state.get("classified_by"):
+            return
+        if self.db.query(ClassificationRecord).filter(ClassificationRecord.email_id == state["email_id"]).first():
+            return
+        self.db.add(ClassificationRecord(
+            email_id=state["email_id"],
+            sender=state.get("email_from"),
+            subject=state.get("email_subject"),
+            body=(state.get("email_body") or "")[:4000],
+            is_inquiry=bool(state.get("is_valid_inquiry")),
+            confidence=state.get("confidence_score"),
+            classified_by=state["classified_by"]
+        ))
+        self.db.commit()
+
+    def get_classification_history(self, classified_by="llm", limit=None):
+        """Labelled emails, oldest first; defaults to LLM decisions so the prefilter never trains on itself"""
+        query = self.db.query(ClassificationRecord).order_by(ClassificationRecord.id)
+        if classified_by:
+            query = query.filter(ClassificationRecord.classified_by == classified_by)
+        if limit:
+            query = query.limit(limit)
+        return query.all()
+
+    # Pipeline output a near-duplicate inquiry can reuse instead of re-running the LLM.
+    # Who is asking (client_name, company) belongs to the sender, so it is never reused.
+    REUSABLE_FIELDS = (
+        "project_type", "requirements", "timeline", "budget", "project_plan", "cost_estimate"
+    )
+
+    def save_fingerprint(self, state, client_id):
+        fingerprint = state.get("fingerprint")
+        if fingerprint is None:
+            return
+        if self.db.query(EmailFingerprint).filter(EmailFingerprint.email_id == state["email_id"]).first():
+            return
+        b = bands(fingerprint)
+        self.db.add(EmailFingerprint(
+            email_id=state["email_id"],
+            client_id=client_id,
+            sender=sender_address(state.get("email_from")),
+            simhash=to_signed(fingerprint),
+            band0=b[0], band1=b[1], band2=b[2], band3=b[3],
+            pipeline_state=json.dumps({k: state.get(k) for k in self.REUSABLE_FIELDS})
+        ))
+        self.db.commit()
+
+    def find_near_duplicate(self, fingerprint, max_distance, since=None):
+        """Closest stored fingerprint within ``max_distance`` bits, as ``(row, distance)``, or None"""
+        b = bands(fingerprint)
+        query = self.db.query(EmailFingerprint).filter(or_(
+            EmailFingerprint.band0 == b[0],
+            EmailFingerprint.band1 == b[1],
+            EmailFingerprint.band2 == b[2],
+            EmailFingerprint.band3 == b[3]
+        ))
+        if since is not None:
+            query = query.filter(EmailFingerprint.created_at >= since)
+        best = None
+        for row in query:
+            distance = hamming(fingerprint, to_unsigned(row.simhash))
+            if distance <= max_distance and (best is None or distance < best[1]):
+                best = (row, distance)
+        return best
+
+    def save_run_metrics(self, state, proposal_id=None):
+        timings = state.get("timings") or {}
+        if not timings or self.db.query(RunMetrics).filter(RunMetrics.email_id == state["email_id"]).first():
+            return
+        self.db.add(RunMetrics(
+            email_id=state["email_id"],
+            proposal_id=proposal_id,
+            total_seconds=timings.get("total"),
+            timings=json.dumps(timings),
+            usage=json.dumps(state.get("usage") or {})
+        ))
+        self.db.commit()
+
+    def get_run_metrics(self, proposal_id):
+        row = self.db.query(RunMetrics).filter(RunMetrics.proposal_id == proposal_id).first()
+        if not row:
+            return None
+        return {
+            "email_id": row.email_id,
+            "proposal_id": row.proposal_id,
+            "total_seconds": row.total_seconds,
+            "timings": json.loads(row.timings),
+            "usage": json.loads(row.usage),
+            "created_at": row.created_at.isoformat()
+        }
+
     def close(self):
         self.db.close()
@@ -2,20 +2,70 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import asyncio
+from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from app.api.routes import router as api_router
 from app.models import init_db
+from app.services.ingestion_service import poll_inbox
+from agent.checkpointing import hold_checkpointer
+from integrations.email_factory import config as backend_config
+from integrations.provider_registry import registry
+from integrations.imap_pool import close_all_pools as close_imap_pools
+from integrations.smtp_pool import close_all_pools as close_smtp_pools
 
 # Initialize
 init_db()
-app = FastAPI(title="Email AI Copilot MVP")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    listener, task = None, None
+    # Build and prime the LLM provider in the background; /health/ready reports when it is done
+    warmup = asyncio.create_task(registry.warm_up())
+    # IMAP settings are only loaded (and required) when the IMAP backend is in use
+    email_config = None
+    if backend_config.EMAIL_BACKEND == "imap":
+        from integrations.standard_email import config as email_config
+    # One checkpoint connection for every poll while the app runs
+    async with hold_checkpointer():
+        if email_config and email_config.IMAP_IDLE_ENABLED:
+            from integrations.imap_idle import IMAPIdleListener
+            listener = IMAPIdleListener(
+                on_new_mail=poll_inbox,
+                host=email_config.IMAP_SERVER,
+                user=email_config.EMAIL_USER,
+                password=email_config.EMAIL_PASSWORD,
+                renew_after=email_config.IMAP_IDLE_RENEW,
+                poll_interval=email_config.IMAP_POLL_INTERVAL
+            )
+            task = asyncio.create_task(listener.run())
+            print("📬 IMAP IDLE listener started")
+        yield
+        if listener:
+            listener.stop()
+            task.cancel()
+        warmup.cancel()
+        registry.close()
+        # Log out of the pooled IMAP and SMTP sessions instead of dropping them
+        await asyncio.to_thread(close_imap_pools)
+        await asyncio.to_thread(close_smtp_pools)
+
+
+app = FastAPI(title="Email AI Copilot MVP", lifespan=lifespan)
 
 app.include_router(api_router, prefix="/api")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+@app.get("/health/ready")
+async def readiness():
+    """200 once the LLM provider is built and warmed up, 503 (with its state) until then"""
+    status = registry.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
 @app.get("/", response_class=HTMLResponse)
 async def dashboard():
     with open("dashboard.html", "r") as f:
@@ -0,0 +1,61 @@
+"""In-process metrics: counters, gauges and sliding-window latency summaries"""
+import threading
+from collections import defaultdict, deque
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class MetricsRegistry:
+    """Thread-safe registry; observations keep only the last ``window`` samples"""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value):
+        with self._lock:
+            self._samples[name].append(value)
+
+    def summary(self, name):
+        with self._lock:
+            values = list(self._samples.get(name, ()))
+        return {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": max(values) if values else 0.0
+        }
+
+    def snapshot(self, prefix=""):
+        with self._lock:
+            counters = {k: v for k, v in self._counters.items() if k.startswith(prefix)}
+            gauges = {k: v for k, v in self._gauges.items() if k.startswith(prefix)}
+            names = [k for k in self._samples if k.startswith(prefix)]
+        return {
+            "counters": counters,
+            "gauges": gauges,
+            "latency": {name: self.summary(name) for name in names}
+        }
+
+
+metrics = MetricsRegistry()
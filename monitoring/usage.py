@@ -0,0 +1,52 @@
+"""Per-node LLM usage accounting, collected through a context variable.
+
+The graph opens a fresh usage dict around each node (``track_usage``); every
+LLM call made while the node runs, including calls from tasks it spawns,
+adds to it through ``record``.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar("llm_usage", default=None)
+
+USAGE_FIELDS = ("calls", "prompt_tokens", "completion_tokens", "llm_seconds", "queue_wait",
+                "cache_hits", "fallbacks", "errors", "retries")
+
+
+def count_tokens(text):
+    """Rough token count (4 characters per token), good enough for budgeting"""
+    return (len(text or "") + 3) // 4
+
+
+def new_usage():
+    return {**{field: 0 for field in USAGE_FIELDS}, "provider": None}
+
+
+@contextmanager
+def track_usage():
+    usage = new_usage()
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        _current.reset(token)
+
+
+def record(provider=None, **values):
+    """Add to the usage of the node currently running; a no-op outside one"""
+    usage = _current.get()
+    if usage is None:
+        return
+    if provider:
+        usage["provider"] = provider
+    for field, value in values.items():
+        usage[field] += value
+
+
+def merge_usage(total, usage):
+    """Sum two usage dicts (a node can run more than once per email)"""
+    if not total:
+        return dict(usage)
+    merged = {field: total.get(field, 0) + usage.get(field, 0) for field in USAGE_FIELDS}
+    merged["provider"] = usage.get("provider") or total.get("provider")
+    return {**total, **usage, **merged}
@@ -5,6 +5,11 @@ def reset_all():
     c = conn.cursor()
     c.execute("DELETE FROM clients")
     c.execute("DELETE FROM proposals")
+    try:
+        # Proposal IDs are reused after a reset; their inquiry details must go too
+        c.execute("DELETE FROM proposal_inquiries")
+    except sqlite3.OperationalError:
+        pass  # created by init_db on the next app start
     conn.commit()
     print("Database cleared.")
     conn.close()
@@ -0,0 +1,99 @@
+"""Compare the two-node, speculative and fused classify+extract paths on the mock provider.
+
+Counts prompt/response tokens (approximate: 4 characters per token) and LLM
+calls per email, and measures wall time with a simulated per-call latency.
+
+    python scripts/benchmark_fused.py --emails 20 --latency 0.4
+"""
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+import asyncio
+import time
+from agent.graph import EmailAgentGraph
+from integrations.llm_wrapper import EnhancedMockService
+
+SAMPLES = [
+    ("Client {i} <client{i}@financecorp.com>", "Portfolio tracking system #{i}",
+     "Hi, we need an AI agent that tracks our investment portfolio in real time, "
+     "alerts on risk and integrates with our brokers. Budget around $20k, 3 months. " * 4),
+    ("client{i}@startup.io", "Website for our startup #{i}",
+     "Hello, we are looking for someone to build a web application with a React "
+     "frontend, Python backend and user accounts. Timeline is about 2 months. " * 4),
+]
+
+
+class CountingLLM:
+    """Stands in for UnifiedLLM: mock answers plus token/latency accounting"""
+
+    def __init__(self, latency):
+        self.service = EnhancedMockService()
+        self.latency = latency
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    async def invoke(self, prompt: str, cache: bool = True) -> str:
+        await asyncio.sleep(self.latency)
+        response = await self.service.invoke(prompt)
+        self.calls += 1
+        self.prompt_tokens += len(prompt) // 4
+        self.completion_tokens += len(response) // 4
+        return response
+
+    async def astream(self, prompt: str):
+        yield await self.invoke(prompt)
+
+
+def make_emails(count):
+    emails = []
+    for i in range(count):
+        sender, subject, body = SAMPLES[i % len(SAMPLES)]
+        emails.append({
+            "id": f"bench-{i}",
+            "from": sender.format(i=i),
+            "subject": subject.format(i=i),
+            "body": body,
+            "thread_id": f"bench-{i}"
+        })
+    return emails
+
+
+async def run_mode(mode, emails, latency):
+    llm = CountingLLM(latency)
+    agent = EmailAgentGraph(llm, fused=mode == "fused", speculation="always" if mode == "speculative" else "off")
+    started = time.perf_counter()
+    for email in emails:
+        await agent.process_email(email)
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "calls": llm.calls,
+        "prompt_tokens": llm.prompt_tokens,
+        "completion_tokens": llm.completion_tokens,
+        "seconds": elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3, help="simulated seconds per LLM call")
+    args = parser.parse_args()
+
+    emails = make_emails(args.emails)
+    rows = [asyncio.run(run_mode(mode, emails, args.latency)) for mode in ("two-node", "speculative", "fused")]
+
+    print(f"\n{'mode':<12} {'calls':>6} {'prompt tok':>11} {'compl. tok':>11} {'seconds':>8} {'s/email':>8}")
+    for r in rows:
+        print(f"{r['mode']:<12} {r['calls']:>6} {r['prompt_tokens']:>11} {r['completion_tokens']:>11} "
+              f"{r['seconds']:>8.2f} {r['seconds'] / len(emails):>8.3f}")
+    base, speculative, fused = rows
+    print(f"\nspeculative saves {1 - speculative['seconds'] / base['seconds']:.1%} wall time at the same token cost")
+    print(f"fused saves {1 - fused['prompt_tokens'] / base['prompt_tokens']:.1%} prompt tokens "
+          f"and {1 - fused['seconds'] / base['seconds']:.1%} wall time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Train the agent prefilter's naive Bayes model from stored LLM classifications.
+
+    python scripts/train_prefilter.py [--holdout 0.2] [--output prefilter_model.json]
+"""
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+from app.models import init_db
+from integrations.storage import StorageService
+from agent.prefilter import NaiveBayesModel, email_text, config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction of newest emails held out for evaluation")
+    parser.add_argument("--output", default=config.PREFILTER_MODEL_PATH)
+    args = parser.parse_args()
+
+    init_db()
+    storage = StorageService()
+    try:
+        records = storage.get_classification_history()
+        samples = [(email_text(r.subject, r.sender, r.body), r.is_inquiry) for r in records]
+    finally:
+        storage.close()
+
+    inquiries = sum(1 for _, label in samples if label)
+    print(f"{len(samples)} labelled emails ({inquiries} inquiries, {len(samples) - inquiries} other)")
+    if len(samples) < config.PREFILTER_MIN_TRAINING:
+        print(f"Need at least {config.PREFILTER_MIN_TRAINING} (PREFILTER_MIN_TRAINING); keep running with the LLM classifier.")
+        return
+
+    split = int(len(samples) * (1 - args.holdout))
+    if 0 < split < len(samples):
+        model = NaiveBayesModel().fit(samples[:split])
+        held_out = samples[split:]
+        rejected = escalated = wrong_rejects = 0
+        for text, label in held_out:
+            p = model.predict_proba(text)
+            if p <= config.PREFILTER_REJECT_BELOW:
+                rejected += 1
+                wrong_rejects += bool(label)
+            elif p < config.PREFILTER_ACCEPT_ABOVE:
+                escalated += 1
+        print(f"Holdout ({len(held_out)}): {rejected} would skip the LLM, {escalated} escalated, "
+              f"{wrong_rejects} inquiries wrongly rejected")
+
+    NaiveBayesModel().fit(samples).save(args.output)
+    print(f"Saved model trained on {len(samples)} emails to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
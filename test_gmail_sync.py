@@ -0,0 +1,195 @@
+"""Test the Gmail sync engine against a stub Gmail service"""
+import httplib2
+from googleapiclient.errors import HttpError
+from integrations.gmail_sync import GmailSyncEngine
+
+
+def http_error(status, reason):
+    return HttpError(httplib2.Response({"status": status, "reason": reason}), reason.encode())
+
+
+class Call:
+    """A prepared API request: nothing happens until execute()"""
+
+    def __init__(self, run):
+        self.run = run
+
+    def execute(self):
+        return self.run()
+
+
+class StubBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.calls = []
+
+    def add(self, call, request_id):
+        self.calls.append((request_id, call))
+
+    def execute(self):
+        self.service.batches.append([request_id for request_id, _ in self.calls])
+        for request_id, call in self.calls:
+            try:
+                self.callback(request_id, call.execute(), None)
+            except HttpError as e:
+                self.callback(request_id, None, e)
+
+
+class StubGmail:
+    """Just enough of the discovery-built service: history.list, getProfile, messages.list/get, batches.
+
+    ``history`` is the list of history records, or an HttpError for history.list to raise;
+    ``rate_limited`` maps a message ID to how many of its gets fail with a 429.
+    """
+
+    def __init__(self, messages, history=(), history_id="900", rate_limited=None):
+        self.inbox = {m["id"]: m for m in messages}
+        self.records = history
+        self.history_id = history_id
+        self.rate_limited = dict(rate_limited or {})
+        self.requests = []
+        self.batches = []
+
+    # service.users().<resource>() all resolve to this stub
+    def users(self):
+        return self
+
+    def history(self):
+        return StubHistory(self)
+
+    def messages(self):
+        return StubMessages(self)
+
+    def getProfile(self, userId):
+        self.requests.append("users.getProfile")
+        return Call(lambda: {"emailAddress": "me@example.com", "historyId": self.history_id})
+
+    def new_batch_http_request(self, callback):
+        return StubBatch(self, callback)
+
+
+class StubHistory:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId, startHistoryId, historyTypes, labelId, pageToken=None):
+        def run():
+            self.service.requests.append("history.list")
+            if isinstance(self.service.records, HttpError):
+                raise self.service.records
+            return {"history": list(self.service.records), "historyId": self.service.history_id}
+        return Call(run)
+
+
+class StubMessages:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId, q, maxResults):
+        def run():
+            self.service.requests.append("messages.list")
+            return {"messages": [{"id": m} for m in list(self.service.inbox)[:maxResults]]}
+        return Call(run)
+
+    def get(self, userId, id, format):
+        def run():
+            if self.service.rate_limited.get(id, 0) > 0:
+                self.service.rate_limited[id] -= 1
+                raise http_error(429, "Too Many Requests")
+            return self.service.inbox[id]
+        return Call(run)
+
+
+def message(msg_id):
+    return {"id": msg_id, "threadId": f"t-{msg_id}", "labelIds": ["INBOX", "UNREAD"]}
+
+
+def added(record_id, *msg_ids, labels=("INBOX", "UNREAD")):
+    return {"id": record_id, "messagesAdded": [{"message": {"id": m, "labelIds": list(labels)}} for m in msg_ids]}
+
+
+def test_history_delta():
+    """Only unread messages added since the cursor are fetched, in one batch"""
+    service = StubGmail(
+        [message("a"), message("b"), message("c")],
+        history=[added("101", "a"), added("102", "b", labels=["INBOX"]), added("103", "c")]
+    )
+    messages, history_id, failed = GmailSyncEngine(service).sync("100")
+    assert [m["id"] for m in messages] == ["a", "c"]
+    assert history_id == "900"
+    assert failed == []
+    assert service.requests == ["history.list"]
+    assert service.batches == [["a", "c"]]
+    print("✓ history delta")
+
+
+def test_history_delta_is_capped_at_whole_records():
+    service = StubGmail(
+        [message(m) for m in "abcd"],
+        history=[added("101", "a"), added("102", "b", "c"), added("103", "d")]
+    )
+    messages, history_id, failed = GmailSyncEngine(service).sync("100", max_results=2)
+    assert [m["id"] for m in messages] == ["a", "b", "c"]
+    assert history_id == "102"  # the next sync resumes after record 102 and picks up "d"
+    print("✓ delta capped at whole records")
+
+
+def test_expired_history_id_falls_back_to_bootstrap():
+    """history.list 404s once the cursor is too old: resync from messages.list and the profile's historyId"""
+    service = StubGmail(
+        [message("a"), message("b"), message("c")],
+        history=http_error(404, "Not Found"),
+        history_id="950"
+    )
+    messages, history_id, failed = GmailSyncEngine(service).sync("1", max_results=2)
+    assert service.requests == ["history.list", "users.getProfile", "messages.list"]
+    assert [m["id"] for m in messages] == ["a", "b"]
+    assert history_id == "950"
+    assert failed == []
+    print("✓ expired historyId falls back to bootstrap")
+
+
+def test_other_history_errors_are_raised():
+    service = StubGmail([message("a")], history=http_error(500, "Backend Error"))
+    try:
+        GmailSyncEngine(service).sync("100")
+        raise AssertionError("expected HttpError")
+    except HttpError as e:
+        assert e.resp.status == 500
+    assert "users.getProfile" not in service.requests
+    print("✓ non-404 history errors raised")
+
+
+def test_partial_batch_failure_is_retried():
+    """Only the gets that failed are sent again, and the result keeps the input order"""
+    service = StubGmail([message(m) for m in "abc"], rate_limited={"b": 1})
+    messages, failed = GmailSyncEngine(service).batch_get(["a", "b", "c"])
+    assert service.batches == [["a", "b", "c"], ["b"]]
+    assert [m["id"] for m in messages] == ["a", "b", "c"]
+    assert failed == []
+    print("✓ partial batch failure retried")
+
+
+def test_persistent_batch_failure_is_reported():
+    """A get still failing after the retry comes back in failed_ids, and the cursor still moves on"""
+    service = StubGmail(
+        [message(m) for m in "abc"],
+        history=[added("101", "a", "b", "c")],
+        rate_limited={"c": 2}
+    )
+    messages, history_id, failed = GmailSyncEngine(service).sync("100")
+    assert service.batches == [["a", "b", "c"], ["c"]]
+    assert [m["id"] for m in messages] == ["a", "b"]
+    assert failed == ["c"]
+    assert history_id == "900"
+    print("✓ persistent batch failure reported")
+
+
+if __name__ == "__main__":
+    test_history_delta()
+    test_history_delta_is_capped_at_whole_records()
+    test_expired_history_id_falls_back_to_bootstrap()
+    test_other_history_errors_are_raised()
+    test_partial_batch_failure_is_retried()
+    test_persistent_batch_failure_is_reported()
@@ -0,0 +1,211 @@
+"""Test the IMAP IDLE listener against a local IMAP stand-in server"""
+import asyncio
+import imaplib
+import socketserver
+import threading
+import time
+from integrations.imap_idle import IMAPIdleListener
+
+
+class StandInHandler(socketserver.StreamRequestHandler):
+    """Just enough IMAP4rev1 for the listener: CAPABILITY, LOGIN, SELECT, NOOP, IDLE, LOGOUT"""
+
+    def send(self, *lines):
+        # One write, so lines after a tagged response land in imaplib's read buffer together
+        self.wfile.write(b"".join(line.encode() + b"\r\n" for line in lines))
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        self.send("* OK stand-in ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, command = line.decode().split()[:2]
+            command = command.upper()
+            server.commands.append(command)
+            if command == "CAPABILITY":
+                self.send(f"* CAPABILITY {server.capabilities}", f"{tag} OK CAPABILITY completed")
+            elif command == "LOGIN":
+                self.send(f"{tag} OK LOGIN completed")
+            elif command == "SELECT":
+                self.send("* 1 EXISTS", "* OK [UIDVALIDITY 7] UIDs valid", f"{tag} OK [READ-WRITE] SELECT completed",
+                          *server.after_select)
+            elif command == "NOOP":
+                self.send(f"{tag} OK NOOP completed")
+            elif command == "IDLE":
+                self.send("+ idling")
+                if server.push is not None:
+                    delay, pushed = server.push
+                    time.sleep(delay)
+                    self.send(*pushed)
+                done = self.rfile.readline()
+                server.commands.append(done.decode().strip())
+                self.send(f"{tag} OK IDLE terminated")
+            elif command == "LOGOUT":
+                self.send("* BYE logging out", f"{tag} OK LOGOUT completed")
+                return
+            else:
+                self.send(f"{tag} BAD unknown command")
+
+
+def start_server(capabilities="IMAP4rev1 IDLE", after_select=(), push=None):
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    server.capabilities = capabilities
+    server.after_select = list(after_select)  # unsolicited lines sent right after SELECT's OK
+    server.push = push  # (delay, lines) sent while IDLE is running
+    server.commands = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_listener(server, on_new_mail=None, **kwargs):
+    host, port = server.server_address
+
+    async def ignore():
+        pass
+
+    return IMAPIdleListener(
+        on_new_mail=on_new_mail or ignore,
+        host=host,
+        user="user",
+        password="secret",
+        connect=lambda: imaplib.IMAP4(host, port),
+        **kwargs
+    )
+
+
+def test_idle_push_is_announced():
+    """An EXISTS pushed during IDLE ends the wait and is reported as new mail"""
+    server = start_server(push=(0.2, ["* 2 EXISTS"]))
+    listener = make_listener(server, renew_after=10)
+    mail = listener._open()
+    try:
+        started = time.monotonic()
+        assert listener._idle_once(mail) is True
+        assert time.monotonic() - started < 5
+        assert server.commands[-2:] == ["IDLE", "DONE"]
+    finally:
+        listener._logout(mail)
+        server.shutdown()
+    print("✓ pushed EXISTS ends IDLE")
+
+
+def test_idle_sees_lines_already_buffered_by_imaplib():
+    """An EXISTS that arrived with SELECT's response sits in imaplib's buffer, not on the socket"""
+    server = start_server(after_select=["* 2 EXISTS"])
+    listener = make_listener(server, renew_after=10)
+    mail = listener._open()
+    try:
+        started = time.monotonic()
+        assert listener._idle_once(mail) is True
+        assert time.monotonic() - started < 5
+    finally:
+        listener._logout(mail)
+        server.shutdown()
+    print("✓ buffered EXISTS is not lost")
+
+
+def test_idle_is_renewed():
+    """Without mail, IDLE is ended with DONE after renew_after and the session stays usable"""
+    server = start_server()
+    listener = make_listener(server, renew_after=0.3)
+    listener.tick = 0.1
+    mail = listener._open()
+    try:
+        assert listener._idle_once(mail) is False
+        assert listener._idle_once(mail) is False
+        assert server.commands.count("DONE") == 2
+        assert mail.noop()[0] == "OK"
+    finally:
+        listener._logout(mail)
+        server.shutdown()
+    print("✓ IDLE renewed")
+
+
+def test_run_dispatches_on_push():
+    """run(): one catch-up dispatch on connect, then one per pushed EXISTS"""
+    server = start_server(push=(0.2, ["* 2 EXISTS"]))
+    calls = []
+
+    async def on_new_mail():
+        calls.append(time.monotonic())
+        if len(calls) == 2:
+            listener.stop()
+
+    listener = make_listener(server, on_new_mail=on_new_mail, renew_after=10)
+    listener.tick = 0.1
+
+    async def main():
+        await asyncio.wait_for(listener.run(), 10)
+
+    try:
+        asyncio.run(main())
+    finally:
+        server.shutdown()
+    assert len(calls) == 2
+    assert "LOGOUT" in server.commands
+    print("✓ run() dispatched on push")
+
+
+def test_run_drains_a_burst_larger_than_one_batch():
+    """A handler reporting a full batch is called again before the listener goes back to IDLE"""
+    server = start_server()
+    calls = []
+
+    async def on_new_mail():
+        calls.append(time.monotonic())
+        if len(calls) == 3:
+            listener.stop()
+            return False
+        return True  # a full batch: more mail is waiting
+
+    listener = make_listener(server, on_new_mail=on_new_mail, renew_after=10)
+    listener.tick = 0.1
+
+    async def main():
+        await asyncio.wait_for(listener.run(), 10)
+
+    try:
+        asyncio.run(main())
+    finally:
+        server.shutdown()
+    assert len(calls) == 3
+    # All three polls ran on connect, without waiting for another push
+    assert "IDLE" not in server.commands
+    print("✓ burst drained")
+
+
+def test_polling_fallback_without_idle():
+    """A server without the IDLE capability is polled every poll_interval"""
+    server = start_server(capabilities="IMAP4rev1")
+    calls = []
+
+    async def on_new_mail():
+        calls.append(time.monotonic())
+        if len(calls) == 3:
+            listener.stop()
+
+    listener = make_listener(server, on_new_mail=on_new_mail, poll_interval=0.1)
+
+    async def main():
+        await asyncio.wait_for(listener.run(), 10)
+
+    try:
+        asyncio.run(main())
+    finally:
+        server.shutdown()
+    assert len(calls) == 3
+    assert "IDLE" not in server.commands
+    print("✓ polling fallback")
+
+
+if __name__ == "__main__":
+    test_idle_push_is_announced()
+    test_idle_sees_lines_already_buffered_by_imaplib()
+    test_idle_is_renewed()
+    test_run_dispatches_on_push()
+    test_run_drains_a_burst_larger_than_one_batch()
+    test_polling_fallback_without_idle()
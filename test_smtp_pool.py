@@ -0,0 +1,164 @@
+"""Test the pooled SMTP sender against a local SMTP sink"""
+import smtplib
+import socketserver
+import threading
+from email.mime.text import MIMEText
+from integrations.smtp_pool import SMTPConnectionPool
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept mail; ``server.script`` injects failures at MAIL FROM"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command.split(" ", 1)[0].upper()
+            server.commands.append(verb)
+            if verb == "MAIL" and server.script:
+                with server.lock:
+                    action = server.script.pop(0) if server.script else None
+                if action == "drop":
+                    return  # connection reset mid-transaction
+                if action:
+                    self.reply(action)
+                    if action.startswith("421"):
+                        return
+                    continue
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 sink")
+            elif verb in ("MAIL", "RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                self.reply("550 no such user" if "rejected@" in command else "250 OK")
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                lines = []
+                while (data := self.rfile.readline()) not in (b".\r\n", b""):
+                    lines.append(data)
+                server.messages.append(b"".join(lines))
+                self.reply("250 queued")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+def start_sink(script=()):
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SinkHandler)
+    server.daemon_threads = True
+    server.script = list(script)  # replies (or "drop") for the next MAIL FROM commands
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.commands = []
+    server.messages = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_pool(server, **kwargs):
+    host, port = server.server_address
+    return SMTPConnectionPool(host, port, "user", "secret", connect=lambda: smtplib.SMTP(host, port), **kwargs)
+
+
+def message(to="client@example.com", subject="Proposal"):
+    msg = MIMEText("Hello")
+    msg["From"] = "me@example.com"
+    msg["To"] = to
+    msg["Subject"] = subject
+    return msg
+
+
+def test_sessions_are_reused():
+    server = start_sink()
+    pool = make_pool(server)
+    try:
+        for i in range(3):
+            pool.send(message(subject=f"Proposal {i}"))
+        assert len(server.messages) == 3
+        assert server.connections == 1
+    finally:
+        pool.close()
+        server.shutdown()
+    print("✓ one session for three sends")
+
+
+def test_421_reconnects_and_retries():
+    """421 means the server is closing the session: drop it and resend on a new one"""
+    server = start_sink(script=["421 service not available"])
+    pool = make_pool(server)
+    try:
+        pool.send(message())
+        assert len(server.messages) == 1
+        assert server.connections == 2
+    finally:
+        pool.close()
+        server.shutdown()
+    print("✓ 421 retried on a fresh session")
+
+
+def test_dropped_connection_reconnects_and_retries():
+    server = start_sink(script=["drop"])
+    pool = make_pool(server)
+    try:
+        pool.send(message())
+        assert len(server.messages) == 1
+        assert server.connections == 2
+    finally:
+        pool.close()
+        server.shutdown()
+    print("✓ dropped connection retried on a fresh session")
+
+
+def test_rejected_message_is_not_retried():
+    """A refused recipient is the message's fault: no retry, and the session is RSET and kept"""
+    server = start_sink()
+    pool = make_pool(server)
+    try:
+        try:
+            pool.send(message(to="rejected@example.com"))
+            raise AssertionError("expected SMTPRecipientsRefused")
+        except smtplib.SMTPRecipientsRefused:
+            pass
+        pool.send(message())
+        assert server.commands.count("MAIL") == 2
+        assert "RSET" in server.commands
+        assert server.connections == 1
+        assert len(server.messages) == 1
+    finally:
+        pool.close()
+        server.shutdown()
+    print("✓ rejected message not retried, session kept")
+
+
+def test_send_many_reports_errors_per_message():
+    server = start_sink()
+    pool = make_pool(server, size=2)
+    try:
+        errors = pool.send_many([message(), message(to="rejected@example.com"), message(), message()])
+        assert [e is None for e in errors] == [True, False, True, True]
+        assert len(server.messages) == 3
+        assert server.connections <= 2
+    finally:
+        pool.close()
+        server.shutdown()
+    print("✓ send_many")
+
+
+if __name__ == "__main__":
+    test_sessions_are_reused()
+    test_421_reconnects_and_retries()
+    test_dropped_connection_reconnects_and_retries()
+    test_rejected_message_is_not_retried()
+    test_send_many_reports_errors_per_message()